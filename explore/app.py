@@ -1,74 +1,462 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import joblib
 import numpy as np
-from PIL import Image
-import tensorflow as tf
-import io
+import hmac
+import json
 import os
+import shutil
+import tempfile
+
+from backends import TFLiteModel
+from batching import MicroBatcher
+from bulk import PARSE_ERRORS, chunked, iter_csv, iter_rows, prime_rows
+from cache import LRUCache, PerceptualCache
+from config import CROP_MODEL_PATH, DISEASE_CLASSES, DISEASE_INT8_MODEL_PATH, DISEASE_MODEL_PATH
+from imaging import ImageRejected, content_hash, decode_image, dhash
+from metrics import metrics
+from registry import ModelRegistry
 
 app = Flask(__name__)
 CORS(app)  
 
-CROP_MODEL_PATH = os.path.join("models", "crop_model.joblib")
-DISEASE_MODEL_PATH = os.path.join("models", "disease_model.joblib")
+# Which disease model to serve: "keras" (full precision) or "int8" (the
+# post-training quantized TFLite model written by quantize.py).
+DISEASE_BACKEND = os.environ.get("DISEASE_BACKEND", "keras")
+
+# Micro-batching for /detect_disease: images arriving within the window are
+# run through the CNN together, up to the max batch size.
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", 10))
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 16))
+
+# Rows per crop_model.predict call in /predict_crop_batch. Bounds memory for
+# arbitrarily large uploads since only one chunk is held at a time.
+CROP_BATCH_CHUNK = int(os.environ.get("CROP_BATCH_CHUNK", 4096))
+
+CROP_TYPES = {"Food Grain": 1, "Pulses": 2, "Oilseeds": 3, "Cash Crop": 4}
+SOIL_TYPES = {"Clay": 1, "Loamy": 2, "Sandy": 3, "Red": 4, "Black": 5}
+
+# /predict_crop result cache. Rainfall is rounded to a multiple of
+# CROP_CACHE_RAINFALL_STEP mm (0 disables rounding) before predicting, so
+# nearby values share an entry. CROP_CACHE_TTL of 0 means no expiry.
+CROP_CACHE_SIZE = int(os.environ.get("CROP_CACHE_SIZE", 4096))
+CROP_CACHE_TTL = float(os.environ.get("CROP_CACHE_TTL", 0))
+CROP_CACHE_RAINFALL_STEP = float(os.environ.get("CROP_CACHE_RAINFALL_STEP", 1.0))
+
+# /detect_disease result cache: exact upload hash, or a 64-bit dHash of the
+# preprocessed image within DISEASE_CACHE_MAX_DISTANCE bits (0 = exact only).
+DISEASE_CACHE_SIZE = int(os.environ.get("DISEASE_CACHE_SIZE", 1024))
+DISEASE_CACHE_MAX_DISTANCE = int(os.environ.get("DISEASE_CACHE_MAX_DISTANCE", 4))
+
+# Comma-separated models to load and warm at startup ("crop,disease"); /ready
+# answers 503 until these are loaded. Anything not listed loads lazily on
+# first use. Under a pre-fork server (gunicorn --preload) the joblib crop
+# model loads once in the parent and the workers share it. TensorFlow does
+# not survive fork(), so the disease model is never loaded in the parent:
+# each worker loads and warms its own copy in the background right after it
+# is forked (in a process that never forks, when /ready is first polled).
+PRELOAD_MODELS = [name.strip() for name in os.environ.get("PRELOAD_MODELS", "").split(",") if name.strip()]
+
+# Seconds between checks of the model files; a changed file is loaded and
+# warmed in the background, then swapped in. 0 disables the watcher.
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", 2))
+
+# POST /admin/reload/<model> requires this in X-Admin-Token, and is
+# disabled (404) while it is unset.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+
+# ===================== MODELS =====================
+def load_crop_model():
+    return joblib.load(CROP_MODEL_PATH)
+
+
+def warmup_crop_model(model):
+    model.predict(np.zeros((1, 3)))
 
-crop_model = joblib.load(CROP_MODEL_PATH)
-disease_model = tf.keras.models.load_model(DISEASE_MODEL_PATH)
+
+def load_disease_model():
+    if DISEASE_BACKEND == "int8":
+        return TFLiteModel(DISEASE_INT8_MODEL_PATH)
+    # Imported here so crop-only workers never pay for TensorFlow.
+    import tensorflow as tf
+    return tf.keras.models.load_model(DISEASE_MODEL_PATH)
+
+
+def warmup_disease_model(model):
+    # The first predict traces the graph; do it before real traffic arrives.
+    model.predict(np.zeros((1, 128, 128, 3)), verbose=0)
+
+
+models = ModelRegistry()
+models.register("crop", load_crop_model, warmup_crop_model, path=CROP_MODEL_PATH)
+models.register(
+    "disease",
+    load_disease_model,
+    warmup_disease_model,
+    path=DISEASE_INT8_MODEL_PATH if DISEASE_BACKEND == "int8" else DISEASE_MODEL_PATH,
+    fork_safe=False,
+)
+
+if PRELOAD_MODELS:
+    models.preload_before_fork(PRELOAD_MODELS)
+models.watch(MODEL_WATCH_INTERVAL)
+
+crop_cache = LRUCache(maxsize=CROP_CACHE_SIZE, ttl=CROP_CACHE_TTL)
+# Cached predictions belong to the model version they came from. The swap
+# replaces the model before clearing, so a cache generation read before
+# models.get() marks results from the old model, and their put() is dropped.
+models.on_swap("crop", crop_cache.clear)
+
+
+def quantize_rainfall(rainfall):
+    if CROP_CACHE_RAINFALL_STEP <= 0:
+        return rainfall
+    return round(rainfall / CROP_CACHE_RAINFALL_STEP) * CROP_CACHE_RAINFALL_STEP
 
 
 def predict_crop_model(data):
     """
     data = {"cropType": "Food Grain", "soilType": "Loamy", "rainfall": 300}
     """
-    crop_type = data.get("cropType", "")
-    soil_type = data.get("soilType", "")
-    rainfall = float(data.get("rainfall", 0))
+    with metrics.time("predict_crop", "encode"):
+        crop_type = data.get("cropType", "")
+        soil_type = data.get("soilType", "")
+        rainfall = float(data.get("rainfall", 0))
 
-    crop_dict = {"Food Grain": 1, "Pulses": 2, "Oilseeds": 3, "Cash Crop": 4}
-    soil_dict = {"Clay": 1, "Loamy": 2, "Sandy": 3, "Red": 4, "Black": 5}
+        crop_val = CROP_TYPES.get(crop_type, 0)
+        soil_val = SOIL_TYPES.get(soil_type, 0)
+        rainfall = quantize_rainfall(rainfall)
 
-    crop_val = crop_dict.get(crop_type, 0)
-    soil_val = soil_dict.get(soil_type, 0)
-
-    features = np.array([[crop_val, soil_val, rainfall]])
-    predicted_crop = crop_model.predict(features)[0]
+    key = (crop_val, soil_val, rainfall)
+    generation = crop_cache.generation
+    predicted_crop = crop_cache.get(key)
+    if predicted_crop is None:
+        metrics.count("cache_lookups", endpoint="predict_crop", result="miss")
+        with metrics.time("predict_crop", "predict"):
+            features = np.array([[crop_val, soil_val, rainfall]])
+            predicted_crop = models.get("crop").predict(features)[0]
+        crop_cache.put(key, predicted_crop, generation)
+    else:
+        metrics.count("cache_lookups", endpoint="predict_crop", result="hit")
     return predicted_crop
 
 
+def encode_categories(values, mapping):
+    """
+    Maps a list of category names to codes (0 for unknown) by looking up
+    each distinct name once instead of once per row.
+    """
+    uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    codes = np.array([mapping.get(name, 0) for name in uniques], dtype=float)
+    return codes[inverse]
+
+
+def encode_crop_rows(rows):
+    """
+    Turns a chunk of request rows into an (N, 3) feature matrix. Rows that
+    are not objects, or whose rainfall is missing, empty, non-numeric or
+    infinite, get NaN and are not predicted.
+    """
+    rows = [row if isinstance(row, dict) else {} for row in rows]
+    crop_types = [str(row.get("cropType") or "") for row in rows]
+    soil_types = [str(row.get("soilType") or "") for row in rows]
+    rainfall = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        try:
+            # float(None) and float("") raise, so a missing value is skipped, not read as 0.
+            rainfall[i] = float(row.get("rainfall"))
+        except (TypeError, ValueError):
+            rainfall[i] = np.nan
+    # "inf" and 1e400 parse as infinity, which the model refuses for the whole chunk.
+    rainfall[~np.isfinite(rainfall)] = np.nan
+
+    features = np.empty((len(rows), 3))
+    features[:, 0] = encode_categories(crop_types, CROP_TYPES)
+    features[:, 1] = encode_categories(soil_types, SOIL_TYPES)
+    features[:, 2] = rainfall
+    return features
+
+
+def predict_crop_chunk(rows):
+    """
+    One crop_model.predict call for a whole chunk. Invalid rows come back as None.
+    """
+    with metrics.time("predict_crop_batch", "encode"):
+        features = encode_crop_rows(rows)
+    valid = np.isfinite(features[:, 2])
+    results = [None] * len(rows)
+    if valid.any():
+        with metrics.time("predict_crop_batch", "predict"):
+            predicted = models.get("crop").predict(features[valid])
+        for i, crop in zip(np.flatnonzero(valid), predicted.tolist()):
+            results[i] = crop
+    return results
+
+
+def iter_crop_rows():
+    """
+    Picks a row reader for the request: a CSV file upload, a CSV body,
+    NDJSON, or a JSON array (the default).
+    """
+    if "file" in request.files:
+        # Flask closes uploaded files once the view returns, before the
+        # streamed response is generated, so spool the upload to our own file.
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(request.files["file"].stream, spool)
+        spool.seek(0)
+        return iter_csv(spool)
+    return iter_rows(request.stream, request.mimetype)
+
+
+def crop_payload(crop):
+    """
+    The JSON body for one recommendation, shared by both servers and the
+    batch endpoint. A numpy label from the model becomes its Python value.
+    """
+    return {"recommended_crop": crop.item() if isinstance(crop, np.generic) else crop}
+
+
+def malformed_body(error):
+    return {"error": f"Malformed request body: {error}"}
+
+
+def crop_batch_lines(rows, ndjson=False):
+    """
+    Predicts chunk by chunk and yields the serialized response body, as
+    NDJSON lines or as pieces of one JSON array. If the body turns out to
+    be malformed partway through, the rows before that point are answered
+    and one final {"error": ...} item closes the response.
+    """
+    parse_errors = []
+
+    def rows_until_error():
+        try:
+            yield from rows
+        except PARSE_ERRORS as e:
+            parse_errors.append(e)
+
+    first = True
+
+    def serialize(items):
+        nonlocal first
+        out = []
+        for item in items:
+            item = json.dumps(item)
+            if ndjson:
+                out.append(item + "\n")
+            else:
+                out.append(item if first else "," + item)
+                first = False
+        return "".join(out)
+
+    if not ndjson:
+        yield "["
+    for chunk in chunked(rows_until_error(), CROP_BATCH_CHUNK):
+        yield serialize(crop_payload(crop) for crop in predict_crop_chunk(chunk))
+    if parse_errors:
+        yield serialize([malformed_body(parse_errors[0])])
+    if not ndjson:
+        yield "]"
+
+
+def preprocess_disease_image(file):
+    """
+    Decodes an uploaded image into a (128, 128, 3) float array in [0, 1],
+    reading from the upload stream without copying it into memory first.
+    """
+    return decode_image(file.stream, size=(128, 128))
+
+
+def predict_disease_batch(img_batch):
+    """
+    Runs the CNN on a stacked (N, 128, 128, 3) batch.
+    """
+    return models.get("disease").predict(img_batch, verbose=0)
+
+
+disease_batcher = MicroBatcher(
+    predict_disease_batch, max_batch_size=BATCH_MAX_SIZE, window_ms=BATCH_WINDOW_MS
+)
+
+disease_cache = PerceptualCache(maxsize=DISEASE_CACHE_SIZE, max_distance=DISEASE_CACHE_MAX_DISTANCE)
+models.on_swap("disease", disease_cache.clear)
+
+
 def predict_disease_model(file):
     """
     Takes uploaded image, preprocesses, and predicts using CNN.
+    Returns the class name, the class probabilities, and response headers
+    describing how the result was produced (cache hit or CNN batch).
     """
-    image = Image.open(io.BytesIO(file.read())).convert("RGB")
-    image = image.resize((128, 128))
-    img_array = np.array(image) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
+    # Read before the batcher fetches the model; see crop_cache.
+    generation = disease_cache.generation
+
+    # An identical upload skips decoding entirely.
+    with metrics.time("detect_disease", "hash"):
+        digest = content_hash(file.stream)
+    cached = disease_cache.get_exact(digest)
+    if cached is not None:
+        metrics.count("cache_lookups", endpoint="detect_disease", result="exact")
+        result, probabilities = cached
+        return result, probabilities, {"X-Cache": "exact"}
+
+    img_array = preprocess_disease_image(file)
+    with metrics.time("detect_disease", "phash"):
+        phash = dhash(img_array)
+    cached, distance = disease_cache.get_similar(phash)
+    if cached is not None:
+        metrics.count("cache_lookups", endpoint="detect_disease", result="near")
+        result, probabilities = cached
+        return result, probabilities, {"X-Cache": "near", "X-Cache-Distance": str(distance)}
 
-    prediction = disease_model.predict(img_array)
-    predicted_class = np.argmax(prediction, axis=1)[0]
+    metrics.count("cache_lookups", endpoint="detect_disease", result="miss")
+    # "predict" is what the request waits (batching window included);
+    # "model" is the forward pass of the batch it ran in.
+    with metrics.time("detect_disease", "predict"):
+        batch = disease_batcher.submit(img_array)
+    metrics.observe("detect_disease", "model", batch.batch_seconds)
+    return disease_batch_result(digest, phash, batch, generation)
 
-    # Example mapping (customize based on your model classes)
-    classes = ["Healthy", "Blight", "Rust", "Leaf Spot"]
-    result = classes[predicted_class]
-    return result
+
+def disease_batch_result(digest, phash, batch, generation):
+    """
+    Turns the CNN output for one image into (class, probabilities, headers)
+    and caches it under both hashes, unless the model was swapped since
+    `generation` was read.
+    """
+    probabilities = [float(p) for p in batch.output]
+    predicted_class = int(np.argmax(batch.output))
+    result = DISEASE_CLASSES[predicted_class]
+
+    disease_cache.put(digest, phash, (result, probabilities), generation)
+    headers = {"X-Cache": "miss"}
+    headers.update(batch.headers())
+    return result, probabilities, headers
 
 
 # ===================== ROUTES =====================
 @app.route("/predict_crop", methods=["POST"])
 def predict_crop():
+    metrics.count("requests", endpoint="predict_crop")
     data = request.get_json()
     crop = predict_crop_model(data)
-    return jsonify({"recommended_crop": crop})
+    with metrics.time("predict_crop", "serialize"):
+        return jsonify(crop_payload(crop))
 
 
 @app.route("/detect_disease", methods=["POST"])
 def detect_disease():
-    file = request.files["image"]
-    result = predict_disease_model(file)
-    return jsonify({"disease_result": result})
+    metrics.count("requests", endpoint="detect_disease")
+    with metrics.time("detect_disease", "upload"):
+        file = request.files["image"]
+    try:
+        result, probabilities, headers = predict_disease_model(file)
+    except ImageRejected as e:
+        metrics.count("rejected", endpoint="detect_disease")
+        return jsonify({"error": str(e)}), 400
+    with metrics.time("detect_disease", "serialize"):
+        response = jsonify({
+            "disease_result": result,
+            "probabilities": dict(zip(DISEASE_CLASSES, probabilities)),
+        })
+    response.headers.update(headers)
+    return response
+
+
+@app.route("/predict_crop_batch", methods=["POST"])
+def predict_crop_batch():
+    """
+    Accepts a JSON array, NDJSON, or CSV (cropType, soilType, rainfall) and
+    streams one recommendation per input row, in order. The response is
+    NDJSON when requested via the Accept header, otherwise a JSON array.
+    A body that is malformed from the start gets a 400; see crop_batch_lines
+    for one that breaks off later.
+    """
+    try:
+        rows = prime_rows(iter_crop_rows())
+    except PARSE_ERRORS as e:
+        return jsonify(malformed_body(e)), 400
+    ndjson = request.accept_mimetypes.best == "application/x-ndjson"
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream_with_context(crop_batch_lines(rows, ndjson)), mimetype=mimetype)
+
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify({"crop": crop_cache.stats(), "disease": disease_cache.stats()})
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Stage latency histograms and counters in Prometheus text format.
+    404 unless METRICS_ENABLED is set.
+    """
+    if not metrics.enabled:
+        return jsonify({"error": "metrics are disabled (set METRICS_ENABLED=1)"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def check_admin_token(token):
+    """
+    None when `token` may use the admin routes, else (error, HTTP status).
+    Without ADMIN_TOKEN they are off: CORS lets any web page call this
+    server, and every reload builds a second full copy of a model.
+    """
+    if not ADMIN_TOKEN:
+        return "admin routes are disabled (set ADMIN_TOKEN)", 404
+    if not hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode()):
+        return "forbidden", 403
+    return None
+
+
+@app.route("/admin/reload/<name>", methods=["POST"])
+def admin_reload(name):
+    """
+    Reloads a model from disk and swaps it in. Runs in the background unless
+    ?wait=1, in which case the reload report (timings, RSS) is returned.
+    """
+    denied = check_admin_token(request.headers.get("X-Admin-Token"))
+    if denied:
+        error, code = denied
+        return jsonify({"error": error}), code
+    if name not in models.names():
+        return jsonify({"error": f"unknown model {name!r}"}), 404
+
+    if request.args.get("wait"):
+        try:
+            report = models.reload(name)
+        except Exception as e:
+            return jsonify({"error": str(e), "status": models.status()[name]}), 500
+        return jsonify({"reloaded": name, "report": report})
+
+    models.reload_async(name)
+    return jsonify({"reloading": name}), 202
+
+
+def readiness():
+    """
+    (body, HTTP status) for /ready: 503 until the PRELOAD_MODELS are loaded
+    and warmed, so a load balancer can hold traffic until then. Any of them
+    not loaded yet (or whose load failed) starts loading in the background,
+    so a worker gets ready without traffic. Lazily loaded models do not hold
+    readiness back.
+    """
+    models.load_async(PRELOAD_MODELS)
+    status = models.status()
+    all_ready = all(status[name]["ready"] for name in PRELOAD_MODELS)
+    return {"ready": all_ready, "models": status}, (200 if all_ready else 503)
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Per-model readiness; see readiness()."""
+    body, code = readiness()
+    return jsonify(body), code
 
 
 # ===================== MAIN =====================
 if __name__ == "__main__":
+    models.preload()
     app.run(debug=True, port=5000)
@@ -0,0 +1,284 @@
+"""
+Async serving mode for the prediction backend.
+
+Same routes and payloads as app.py, but served by aiohttp: reading uploads
+and writing responses happen on the event loop, image decoding runs in a
+bounded decode pool, and model calls run on the micro-batcher thread or a
+bounded inference pool, so a slow upload never holds up a predict.
+
+    pip install aiohttp
+    python async_app.py --port 5000
+"""
+import argparse
+import asyncio
+import functools
+import io
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from aiohttp import web
+
+import app as backend
+from bulk import PARSE_ERRORS, iter_csv, iter_rows, prime_rows
+from imaging import ImageRejected, MAX_UPLOAD_BYTES, content_hash, decode_and_hash, decode_and_hash_in_worker
+from metrics import metrics
+
+# Pool sizes. Decoding can use processes ("process") to get around the GIL
+# for CPU-heavy PNG/JPEG work, or threads ("thread"), which Pillow mostly
+# releases the GIL for anyway.
+DECODE_WORKERS = int(os.environ.get("ASYNC_DECODE_WORKERS", os.cpu_count() or 2))
+DECODE_EXECUTOR = os.environ.get("ASYNC_DECODE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.environ.get("ASYNC_INFERENCE_WORKERS", 2))
+
+# Request bodies for /predict_crop_batch are spooled to disk past this size.
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+def make_decode_pool(kind, workers):
+    if kind == "process":
+        # spawn, not fork: the parent may already hold TensorFlow state.
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+
+
+async def run_in(pool, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, functools.partial(fn, *args))
+
+
+async def decode_upload(pool, data):
+    """(img_array, phash) for an upload, decoded on the decode pool."""
+    if isinstance(pool, ProcessPoolExecutor):
+        img_array, phash, worker_metrics = await run_in(pool, decode_and_hash_in_worker, data)
+        metrics.merge(worker_metrics)
+        return img_array, phash
+    return await run_in(pool, decode_and_hash, data)
+
+
+def json_error(message, status=400):
+    return web.json_response({"error": message}, status=status)
+
+
+async def iter_part(part):
+    while True:
+        chunk = await part.read_chunk(64 * 1024)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def read_part(part, limit):
+    """Reads one multipart field in chunks, refusing to buffer more than `limit` bytes."""
+    data = bytearray()
+    async for chunk in iter_part(part):
+        data.extend(chunk)
+        if limit and len(data) > limit:
+            raise ImageRejected(f"Upload is larger than {limit} bytes")
+    return bytes(data)
+
+
+async def spool_stream(content, spool):
+    async for chunk in content.iter_chunked(64 * 1024):
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+# ===================== ROUTES =====================
+async def predict_crop(request):
+    metrics.count("requests", endpoint="predict_crop")
+    data = await request.json()
+    crop = await run_in(request.app["inference_pool"], backend.predict_crop_model, data)
+    with metrics.time("predict_crop", "serialize"):
+        return web.json_response(backend.crop_payload(crop))
+
+
+async def detect_disease(request):
+    metrics.count("requests", endpoint="detect_disease")
+    data = None
+    reader = await request.multipart()
+    async for part in reader:
+        if part.name == "image":
+            try:
+                with metrics.time("detect_disease", "upload"):
+                    data = await read_part(part, MAX_UPLOAD_BYTES)
+            except ImageRejected as e:
+                metrics.count("rejected", endpoint="detect_disease")
+                return json_error(str(e))
+            break
+    if data is None:
+        return json_error("Missing 'image' file field")
+
+    cache = backend.disease_cache
+    generation = cache.generation  # before the model is fetched; see backend.crop_cache
+
+    # blake2b releases the GIL on large inputs; keep it off the event loop.
+    with metrics.time("detect_disease", "hash"):
+        digest = await run_in(None, content_hash, io.BytesIO(data))
+    cached = cache.get_exact(digest)
+    headers = {"X-Cache": "exact"}
+    if cached is not None:
+        metrics.count("cache_lookups", endpoint="detect_disease", result="exact")
+    else:
+        try:
+            img_array, phash = await decode_upload(request.app["decode_pool"], data)
+        except ImageRejected as e:
+            metrics.count("rejected", endpoint="detect_disease")
+            return json_error(str(e))
+
+        cached, distance = cache.get_similar(phash)
+        headers = {"X-Cache": "near", "X-Cache-Distance": str(distance)}
+        if cached is not None:
+            metrics.count("cache_lookups", endpoint="detect_disease", result="near")
+        else:
+            metrics.count("cache_lookups", endpoint="detect_disease", result="miss")
+            # The batcher's own thread is the inference executor; awaiting
+            # its future keeps this coroutine off any pool thread.
+            with metrics.time("detect_disease", "predict"):
+                batch = await asyncio.wrap_future(backend.disease_batcher.submit_async(img_array))
+            metrics.observe("detect_disease", "model", batch.batch_seconds)
+            cached = backend.disease_batch_result(digest, phash, batch, generation)[:2]
+            headers = {"X-Cache": "miss"}
+            headers.update(batch.headers())
+
+    result, probabilities = cached
+    with metrics.time("detect_disease", "serialize"):
+        return web.json_response(
+            {"disease_result": result, "probabilities": dict(zip(backend.DISEASE_CLASSES, probabilities))},
+            headers=headers,
+        )
+
+
+async def predict_crop_batch(request):
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    if request.content_type.startswith("multipart/"):
+        reader = await request.multipart()
+        rows = None
+        async for part in reader:
+            if part.name == "file":
+                async for chunk in iter_part(part):
+                    spool.write(chunk)
+                spool.seek(0)
+                rows = iter_csv(spool)
+                break
+        if rows is None:
+            return json_error("Missing 'file' field")
+    else:
+        await spool_stream(request.content, spool)
+        rows = iter_rows(spool, request.content_type)
+
+    # Validate the format before the 200 goes out, as app.py does.
+    pool = request.app["inference_pool"]
+    try:
+        rows = await run_in(pool, prime_rows, rows)
+    except PARSE_ERRORS as e:
+        spool.close()
+        return web.json_response(backend.malformed_body(e), status=400)
+
+    ndjson = request.headers.get("Accept", "").startswith("application/x-ndjson")
+    response = web.StreamResponse(
+        headers={"Content-Type": "application/x-ndjson" if ndjson else "application/json"}
+    )
+    await response.prepare(request)
+
+    # Parsing and predicting are blocking, so pull each serialized chunk
+    # from the generator on the inference pool and write it from here.
+    lines = backend.crop_batch_lines(rows, ndjson)
+    while True:
+        piece = await run_in(pool, next, lines, None)
+        if piece is None:
+            break
+        await response.write(piece.encode())
+    await response.write_eof()
+    spool.close()
+    return response
+
+
+async def cache_stats(request):
+    return web.json_response({"crop": backend.crop_cache.stats(), "disease": backend.disease_cache.stats()})
+
+
+async def prometheus_metrics(request):
+    if not metrics.enabled:
+        return json_error("metrics are disabled (set METRICS_ENABLED=1)", status=404)
+    return web.Response(text=metrics.render(), content_type="text/plain")
+
+
+async def admin_reload(request):
+    name = request.match_info["name"]
+    denied = backend.check_admin_token(request.headers.get("X-Admin-Token"))
+    if denied:
+        error, code = denied
+        return json_error(error, status=code)
+    if name not in backend.models.names():
+        return json_error(f"unknown model {name!r}", status=404)
+
+    if request.query.get("wait"):
+        try:
+            report = await run_in(None, backend.models.reload, name)
+        except Exception as e:
+            return web.json_response({"error": str(e), "status": backend.models.status()[name]}, status=500)
+        return web.json_response({"reloaded": name, "report": report})
+
+    backend.models.reload_async(name)
+    return web.json_response({"reloading": name}, status=202)
+
+
+async def ready(request):
+    body, code = backend.readiness()
+    return web.json_response(body, status=code)
+
+
+async def preflight(request):
+    return web.Response(status=204)
+
+
+async def add_cors_headers(request, response):
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    if request.method == "OPTIONS":
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = request.headers.get(
+            "Access-Control-Request-Headers", "Content-Type"
+        )
+
+
+# ===================== APP =====================
+async def close_pools(application):
+    application["decode_pool"].shutdown(wait=False, cancel_futures=True)
+    application["inference_pool"].shutdown(wait=False, cancel_futures=True)
+
+
+def make_app(decode_workers=DECODE_WORKERS, decode_executor=DECODE_EXECUTOR, inference_workers=INFERENCE_WORKERS):
+    application = web.Application(client_max_size=MAX_UPLOAD_BYTES or 1024 ** 3)
+    application["decode_pool"] = make_decode_pool(decode_executor, decode_workers)
+    application["inference_pool"] = ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix="inference")
+    application.on_response_prepare.append(add_cors_headers)
+    application.on_cleanup.append(close_pools)
+    application.router.add_post("/predict_crop", predict_crop)
+    application.router.add_post("/detect_disease", detect_disease)
+    application.router.add_post("/predict_crop_batch", predict_crop_batch)
+    application.router.add_get("/cache_stats", cache_stats)
+    application.router.add_post("/admin/reload/{name}", admin_reload)
+    application.router.add_get("/metrics", prometheus_metrics)
+    application.router.add_get("/ready", ready)
+    application.router.add_route("OPTIONS", "/{tail:.*}", preflight)
+    return application
+
+
+# ===================== MAIN =====================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async prediction server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--decode-workers", type=int, default=DECODE_WORKERS)
+    parser.add_argument("--decode-executor", choices=["thread", "process"], default=DECODE_EXECUTOR)
+    parser.add_argument("--inference-workers", type=int, default=INFERENCE_WORKERS)
+    args = parser.parse_args()
+
+    backend.models.preload()
+    web.run_app(
+        make_app(args.decode_workers, args.decode_executor, args.inference_workers),
+        host=args.host,
+        port=args.port,
+    )
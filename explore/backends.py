@@ -0,0 +1,64 @@
+import threading
+
+import numpy as np
+
+
+def load_tflite_interpreter(path, num_threads=None):
+    """
+    Prefers the standalone LiteRT / tflite-runtime packages when installed,
+    so an int8-only worker does not need full TensorFlow.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=path, num_threads=num_threads)
+
+
+class TFLiteModel:
+    """
+    Wraps a (quantized) .tflite model behind the same predict() call the
+    Keras model offers, so the rest of app.py does not care which one runs.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self.interpreter = load_tflite_interpreter(path, num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input["shape"][0])
+        # An interpreter must not be invoked from two threads at once.
+        self._lock = threading.Lock()
+
+    def _quantize(self, x):
+        dtype = self.input["dtype"]
+        if dtype == np.float32:
+            return x.astype(np.float32)
+        scale, zero_point = self.input["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, y):
+        if self.output["dtype"] == np.float32:
+            return y
+        scale, zero_point = self.output["quantization"]
+        return (y.astype(np.float32) - zero_point) * scale
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x)
+        with self._lock:
+            if len(x) != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input["index"], [len(x), *x.shape[1:]])
+                self.interpreter.allocate_tensors()
+                self.input = self.interpreter.get_input_details()[0]
+                self.output = self.interpreter.get_output_details()[0]
+                self._batch_size = len(x)
+            self.interpreter.set_tensor(self.input["index"], self._quantize(x))
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self.output["index"])
+        return self._dequantize(y)
@@ -0,0 +1,121 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchResult:
+    """
+    Output for one submitted item plus timing of the batch it ran in.
+    """
+
+    def __init__(self, output, batch_size, batch_seconds):
+        self.output = output
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+
+    @property
+    def per_item_ms(self):
+        return self.batch_seconds * 1000.0 / max(self.batch_size, 1)
+
+    @property
+    def throughput(self):
+        """Items per second the model achieved for this batch."""
+        if self.batch_seconds <= 0:
+            return 0.0
+        return self.batch_size / self.batch_seconds
+
+    def headers(self):
+        return {
+            "X-Batch-Size": str(self.batch_size),
+            "X-Batch-Latency-Ms": f"{self.batch_seconds * 1000.0:.2f}",
+            "X-Batch-Per-Image-Ms": f"{self.per_item_ms:.2f}",
+            "X-Batch-Throughput": f"{self.throughput:.1f}",
+        }
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many request threads into one batch.
+
+    The first item opens a window of `window_ms`; everything that arrives
+    before the window closes (up to `max_batch_size`) is stacked and passed
+    to `predict_fn` in a single call. Each caller gets back its own row.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, window_ms=10.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so a child process starts its own.
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._worker.start()
+
+    def submit(self, item, timeout=None):
+        """Queue one item and block until its batch has run."""
+        return self.submit_async(item).result(timeout=timeout)
+
+    def submit_async(self, item):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            futures = [future for _, future in batch]
+            try:
+                inputs = np.stack([item for item, _ in batch])
+                start = time.perf_counter()
+                outputs = self.predict_fn(inputs)
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            for future, output in zip(futures, outputs):
+                future.set_result(BatchResult(output, len(batch), elapsed))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000.0,
+        }
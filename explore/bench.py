@@ -0,0 +1,254 @@
+"""
+Benchmarks for the prediction backend.
+
+Run from the explore/ directory, e.g.
+
+    python bench.py batching --requests 400 --concurrency 32
+"""
+import argparse
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from batching import MicroBatcher
+from imaging import decode_image
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, latencies, wall):
+    print(
+        f"{name:<28} {len(latencies) / wall:8.1f} req/s   "
+        f"p50 {percentile(latencies, 50) * 1000:7.2f} ms   "
+        f"p99 {percentile(latencies, 99) * 1000:7.2f} ms   "
+        f"mean {statistics.mean(latencies) * 1000:7.2f} ms"
+    )
+
+
+# ===================== BATCHING =====================
+def simulated_cnn(overhead_ms, per_image_ms):
+    """
+    Stand-in for disease_model.predict: a fixed per-call cost plus a
+    per-image cost, which is the shape that makes batching pay off. The
+    lock models the CPU being busy for the whole call.
+    """
+    busy = threading.Lock()
+
+    def predict(img_batch):
+        with busy:
+            time.sleep((overhead_ms + per_image_ms * len(img_batch)) / 1000.0)
+        return np.tile(np.array([0.7, 0.1, 0.1, 0.1]), (len(img_batch), 1))
+    return predict
+
+
+def run_batching(args):
+    image = np.zeros((128, 128, 3), dtype=np.float32)
+    predict = simulated_cnn(args.overhead_ms, args.per_image_ms)
+
+    def drive(call):
+        latencies = []
+
+        def one(_):
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(one, range(args.requests)))
+        return latencies, time.perf_counter() - start
+
+    latencies, wall = drive(lambda: predict(image[None]))
+    report("unbatched (batch of 1)", latencies, wall)
+
+    batcher = MicroBatcher(predict, max_batch_size=args.max_batch, window_ms=args.window_ms)
+    last = []
+    latencies, wall = drive(lambda: last.append(batcher.submit(image)))
+    report(f"micro-batched ({args.window_ms:g} ms)", latencies, wall)
+
+    full = [r for r in last if r.batch_size == args.max_batch]
+    if full:
+        print(
+            f"at batch limit ({args.max_batch}): "
+            f"{statistics.mean(r.per_item_ms for r in full):.2f} ms/image, "
+            f"{statistics.mean(r.throughput for r in full):.1f} images/s"
+        )
+    print("batcher stats:", batcher.stats())
+
+
+# ===================== DECODE =====================
+def legacy_decode(data):
+    """The original predict_disease_model preprocessing."""
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    image = image.resize((128, 128))
+    return np.array(image) / 255.0
+
+
+def streaming_decode(data):
+    return decode_image(io.BytesIO(data), size=(128, 128))
+
+
+def decode_worker(mode, path, repeats, results):
+    with open(path, "rb") as f:
+        data = f.read()
+    decode = legacy_decode if mode == "legacy" else streaming_decode
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(repeats):
+        decode(data)
+    elapsed = (time.perf_counter() - start) / repeats
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((mode, elapsed, baseline, peak))
+
+
+def make_test_photo(path):
+    """A synthetic 12 MP "phone photo" with some texture so it compresses realistically."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:3000, 0:4000]
+    base = np.stack([x % 256, y % 256, (x + y) % 256], axis=-1)
+    noise = rng.integers(0, 24, base.shape)
+    Image.fromarray((base + noise).clip(0, 255).astype(np.uint8)).save(path, quality=90)
+
+
+def run_decode(args):
+    # Everything heavy runs in fresh processes so peak RSS reflects one decode
+    # path only (the high-water mark survives exec, so not even the test
+    # photo is built here).
+    ctx = multiprocessing.get_context("spawn")
+
+    path = args.image
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), "bench_12mp.jpg")
+        if not os.path.exists(path):
+            proc = ctx.Process(target=make_test_photo, args=(path,))
+            proc.start()
+            proc.join()
+    print(f"image: {path} ({os.path.getsize(path) / 1e6:.1f} MB, {Image.open(path).size})")
+
+    results = ctx.Queue()
+    for mode in ("legacy", "streaming"):
+        proc = ctx.Process(target=decode_worker, args=(mode, path, args.repeats, results))
+        proc.start()
+        proc.join()
+        mode, elapsed, baseline, peak = results.get()
+        print(
+            f"{mode:<10} {elapsed * 1000:8.1f} ms/image   "
+            f"peak RSS {peak / 1024:7.1f} MB (+{(peak - baseline) / 1024:.1f} MB over baseline)"
+        )
+
+
+# ===================== LOAD =====================
+def multipart_body(field, filename, data):
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    return head + data + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def run_load(args):
+    """
+    Concurrent mixed load against a running server. Start app.py or
+    async_app.py on --url, then run this once against each and compare.
+    """
+    url = urllib.parse.urlsplit(args.url)
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    else:
+        buf = io.BytesIO()
+        Image.fromarray(np.random.default_rng(0).integers(0, 255, (960, 1280, 3), dtype=np.uint8)).save(buf, "JPEG")
+        image = buf.getvalue()
+    crop_body = json.dumps({"cropType": "Pulses", "soilType": "Loamy", "rainfall": 250}).encode()
+
+    def request(i):
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        if i % args.crop_every == 0:
+            path, body, content_type = "/predict_crop", crop_body, "application/json"
+        else:
+            # Unique bytes per request so the result cache does not short-circuit.
+            body, content_type = multipart_body("image", "leaf.jpg", image + i.to_bytes(4, "big"))
+            path = "/detect_disease"
+        start = time.perf_counter()
+        conn.putrequest("POST", path)
+        conn.putheader("Content-Type", content_type)
+        conn.putheader("Content-Length", str(len(body)))
+        conn.endheaders()
+        # Optionally trickle the body to look like a slow mobile upload.
+        step = max(1, len(body) // 8)
+        for offset in range(0, len(body), step):
+            conn.send(body[offset:offset + step])
+            if args.upload_delay_ms:
+                time.sleep(args.upload_delay_ms / 8000.0)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        return path, response.status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(request, range(args.requests)))
+    wall = time.perf_counter() - start
+
+    for path in ("/detect_disease", "/predict_crop"):
+        latencies = [elapsed for p, status, elapsed in results if p == path and status == 200]
+        if latencies:
+            report(path, latencies, wall)
+    errors = sum(1 for _, status, _ in results if status != 200)
+    print(f"total {len(results) / wall:.1f} req/s, {errors} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("batching", help="micro-batching vs one predict per request")
+    p.add_argument("--requests", type=int, default=400)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--window-ms", type=float, default=10.0)
+    p.add_argument("--max-batch", type=int, default=16)
+    p.add_argument("--overhead-ms", type=float, default=8.0)
+    p.add_argument("--per-image-ms", type=float, default=1.0)
+    p.set_defaults(func=run_batching)
+
+    p = sub.add_parser("decode", help="full-resolution vs draft-mode image decode")
+    p.add_argument("--image", help="JPEG to decode (default: synthetic 12 MP photo)")
+    p.add_argument("--repeats", type=int, default=10)
+    p.set_defaults(func=run_decode)
+
+    p = sub.add_parser("load", help="concurrent HTTP load test against a running server")
+    p.add_argument("--url", default="http://127.0.0.1:5000")
+    p.add_argument("--requests", type=int, default=500)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--crop-every", type=int, default=4, help="every Nth request is /predict_crop")
+    p.add_argument("--upload-delay-ms", type=float, default=0.0, help="spread each upload over this long")
+    p.add_argument("--image", help="JPEG to upload (default: synthetic 1280x960)")
+    p.set_defaults(func=run_load)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import codecs
+import csv
+import io
+import json
+from itertools import chain, islice
+
+READ_SIZE = 64 * 1024
+
+# What the row readers raise for a malformed body (JSON and Unicode errors are ValueErrors).
+PARSE_ERRORS = (ValueError, csv.Error)
+
+
+def iter_json_array(stream):
+    """
+    Yields the elements of a top-level JSON array one at a time, reading the
+    stream in fixed-size blocks so the whole body is never held in memory.
+    """
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    started = False
+    eof = False
+
+    while True:
+        # Skip whitespace and separators between elements.
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number cut off by the block boundary (e.g. "1.5e") still
+                # decodes, so only accept items followed by a delimiter.
+                if eof or (end < len(buf) and buf[end] in " \t\r\n,]"):
+                    yield item
+                    pos = end
+                    continue
+
+        if eof:
+            raise ValueError("Unterminated JSON array")
+        block = stream.read(READ_SIZE)
+        eof = not block
+        buf = buf[pos:] + reader.decode(block, final=eof)
+        pos = 0
+
+
+def iter_ndjson(stream):
+    """Yields one object per non-blank line."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_csv(stream):
+    """Yields one dict per CSV row, keyed by the header line."""
+    with io.TextIOWrapper(stream, encoding="utf-8-sig", newline="") as text:
+        for row in csv.DictReader(text):
+            yield row
+
+
+def iter_rows(stream, mimetype):
+    """Picks the row reader for a request body by its content type."""
+    if mimetype == "text/csv":
+        return iter_csv(stream)
+    if mimetype in ("application/x-ndjson", "application/jsonl"):
+        return iter_ndjson(stream)
+    return iter_json_array(stream)
+
+
+def prime_rows(rows):
+    """
+    Reads the first row up front, so a body in the wrong format raises one
+    of PARSE_ERRORS before any of the response is sent. Returns an iterator
+    over all the rows, the first included.
+    """
+    rows = iter(rows)
+    for first in rows:
+        return chain([first], rows)
+    return iter(())
+
+
+def chunked(iterable, size):
+    """Groups an iterable into lists of at most `size` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
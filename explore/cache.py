@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional TTL and hit/miss/eviction counters.
+
+    clear() starts a new generation. A caller that computes a value from
+    state the clear invalidates (e.g. the model being swapped) reads
+    `generation` before it starts and passes it to put(); a put from an
+    older generation is dropped instead of outliving the clear.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.clears = 0
+        self.stale_puts = 0
+        self.generation = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        expires = None if not self.ttl else time.monotonic() + self.ttl
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self.stale_puts += 1
+                return
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.clears += 1
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "clears": self.clears,
+            "stale_puts": self.stale_puts,
+        }
+
+
+# Number of set bits in every byte value, for vectorized popcount.
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(hashes, target):
+    """Bit distance from `target` to each 64-bit hash in `hashes`."""
+    diff = np.bitwise_xor(hashes, np.uint64(target))
+    return _POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class PerceptualCache:
+    """
+    Bounded LRU cache for image results with two ways to hit: the exact
+    content hash of the upload, or a perceptual hash within `max_distance`
+    bits of a cached one. Perceptual hashes live in a fixed numpy array so a
+    near-duplicate lookup is one vectorized scan. put() takes the same
+    `generation` guard as LRUCache.put().
+    """
+
+    def __init__(self, maxsize=1024, max_distance=4):
+        self.maxsize = max(1, int(maxsize))
+        self.max_distance = int(max_distance)
+        self._hashes = np.zeros(self.maxsize, dtype=np.uint64)
+        self._used = np.zeros(self.maxsize, dtype=bool)
+        self._values = [None] * self.maxsize
+        self._content = [None] * self.maxsize
+        self._by_content = {}
+        self._order = OrderedDict()  # slot -> None, least recently used first
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clears = 0
+        self.stale_puts = 0
+        self.generation = 0
+
+    def _touch(self, slot):
+        self._order.move_to_end(slot)
+        return self._values[slot]
+
+    def get_exact(self, content_hash):
+        with self._lock:
+            slot = self._by_content.get(content_hash)
+            if slot is None:
+                return None
+            self.exact_hits += 1
+            return self._touch(slot)
+
+    def get_similar(self, phash):
+        """Returns (value, distance) of the closest entry, or (None, None)."""
+        with self._lock:
+            if self._order:
+                distances = hamming_distances(self._hashes, phash)
+                distances[~self._used] = 65
+                slot = int(np.argmin(distances))
+                distance = int(distances[slot])
+                if distance <= self.max_distance:
+                    self.near_hits += 1
+                    return self._touch(slot), distance
+            self.misses += 1
+            return None, None
+
+    def put(self, content_hash, phash, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self.stale_puts += 1
+                return
+            slot = self._by_content.get(content_hash)
+            if slot is None:
+                if len(self._order) < self.maxsize:
+                    slot = len(self._order)
+                else:
+                    slot, _ = self._order.popitem(last=False)
+                    del self._by_content[self._content[slot]]
+                    self.evictions += 1
+            self._hashes[slot] = np.uint64(phash)
+            self._used[slot] = True
+            self._values[slot] = value
+            self._content[slot] = content_hash
+            self._by_content[content_hash] = slot
+            self._order[slot] = None
+            self._order.move_to_end(slot)
+
+    def clear(self):
+        with self._lock:
+            self._used[:] = False
+            self._values = [None] * self.maxsize
+            self._content = [None] * self.maxsize
+            self._by_content.clear()
+            self._order.clear()
+            self.clears += 1
+            self.generation += 1
+
+    def stats(self):
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "size": len(self._order),
+            "maxsize": self.maxsize,
+            "max_distance": self.max_distance,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "clears": self.clears,
+            "stale_puts": self.stale_puts,
+        }
+
+
+class FileWatch:
+    """
+    Notices when a file is replaced or rewritten, by comparing its
+    (mtime, size, inode). Checks are throttled to one stat() per `interval`.
+    """
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self._signature = self._stat()
+        self._next_check = time.monotonic() + interval
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def changed(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.interval
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return True
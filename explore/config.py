@@ -0,0 +1,13 @@
+"""
+Model locations and class names shared by the servers and the offline tools
+(quantize.py). Importing this module has no side effects: no Flask app,
+registry or file watcher is created.
+"""
+import os
+
+CROP_MODEL_PATH = os.path.join("models", "crop_model.joblib")
+DISEASE_MODEL_PATH = os.path.join("models", "disease_model.joblib")
+DISEASE_INT8_MODEL_PATH = os.path.join("models", "disease_model_int8.tflite")
+
+# Example mapping (customize based on your model classes)
+DISEASE_CLASSES = ["Healthy", "Blight", "Rust", "Leaf Spot"]
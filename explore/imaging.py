@@ -0,0 +1,114 @@
+import hashlib
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+from metrics import metrics
+
+# Upload limits, checked before any pixel data is decoded.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", 50_000_000))
+
+
+class ImageRejected(ValueError):
+    """Raised when an upload is too large or not a readable image."""
+
+
+def stream_size(stream):
+    """
+    Size in bytes of a seekable upload stream, leaving it at its start.
+    Returns None if the stream cannot seek.
+    """
+    try:
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return size
+
+
+def decode_image(stream, size=(128, 128)):
+    """
+    Decodes an uploaded image straight from its stream into a float32
+    array of shape (size[1], size[0], 3) scaled to [0, 1].
+
+    Only the header is parsed before the limits are checked. JPEGs are then
+    decoded in draft mode, which lets libjpeg scale by 1/2, 1/4 or 1/8 while
+    decoding, so a 12 MP photo never exists at full resolution in memory.
+    """
+    if MAX_UPLOAD_BYTES:
+        length = stream_size(stream)
+        if length is not None and length > MAX_UPLOAD_BYTES:
+            raise ImageRejected(f"Upload is {length} bytes, limit is {MAX_UPLOAD_BYTES}")
+
+    try:
+        image = Image.open(stream)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageRejected("Unreadable image") from e
+
+    width, height = image.size
+    if MAX_IMAGE_PIXELS and width * height > MAX_IMAGE_PIXELS:
+        raise ImageRejected(f"Image is {width}x{height} pixels, limit is {MAX_IMAGE_PIXELS}")
+
+    # Picks the largest DCT scale that still gives at least `size`; a no-op
+    # for formats other than JPEG.
+    with metrics.time("detect_disease", "decode"):
+        image.draft("RGB", size)
+        try:
+            image = image.convert("RGB")
+        except OSError as e:
+            raise ImageRejected("Unreadable image") from e
+
+    # reducing_gap does a cheap box reduce first for formats draft() can't shrink.
+    with metrics.time("detect_disease", "resize"):
+        image = image.resize(size, reducing_gap=3.0)
+    with metrics.time("detect_disease", "normalize"):
+        return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def content_hash(stream):
+    """
+    blake2b digest of the upload bytes, read in blocks. Leaves the stream
+    at its start so it can still be decoded.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for block in iter(lambda: stream.read(64 * 1024), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def dhash(img_array, hash_size=8):
+    """
+    64-bit difference hash of a preprocessed image: compares neighbouring
+    pixels of a 9x8 grayscale thumbnail, so it survives recompression,
+    small crops and lighting changes that would change every byte.
+    """
+    gray = (np.asarray(img_array).mean(axis=2) * 255).astype(np.uint8)
+    thumb = Image.fromarray(gray).resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def decode_and_hash(data, size=(128, 128)):
+    """
+    decode_image() plus dhash() for an upload already in memory. A plain
+    module-level function so it can run in a process pool.
+    """
+    img_array = decode_image(io.BytesIO(data), size=size)
+    with metrics.time("detect_disease", "phash"):
+        return img_array, dhash(img_array)
+
+
+def decode_and_hash_in_worker(data, size=(128, 128)):
+    """
+    decode_and_hash() for a process pool. Stage timings recorded in a worker
+    process never reach the server's /metrics, so they are returned with the
+    result as a third item, for the server to merge.
+    """
+    img_array, phash = decode_and_hash(data, size=size)
+    return img_array, phash, metrics.take()
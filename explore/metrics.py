@@ -0,0 +1,142 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Set METRICS_ENABLED=1 to collect stage timings and serve /metrics. When
+# off, every timer is a shared no-op context manager.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+
+# Seconds. Spans sub-millisecond encode/normalize up to multi-second uploads.
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+def _labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+class Metrics:
+    """
+    Per-stage latency histograms and event counters, rendered in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, prefix="krishi"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, endpoint, stage):
+        key = (("endpoint", endpoint), ("stage", stage))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def time(self, endpoint, stage):
+        """Context manager that records how long its block took."""
+        if not self.enabled:
+            return _NOOP
+        return _Timer(self._histogram(endpoint, stage))
+
+    def observe(self, endpoint, stage, seconds):
+        if self.enabled:
+            self._histogram(endpoint, stage).observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def take(self):
+        """
+        Returns everything recorded so far and starts over. A worker process
+        ships this back to the server, which merge()s it into its own metrics.
+        """
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+            counters, self._counters = self._counters, {}
+        return {key: (list(h.counts), h.sum, h.count) for key, h in histograms.items()}, counters
+
+    def merge(self, taken):
+        histograms, counters = taken
+        for key, (counts, total, count) in histograms.items():
+            histogram = self._histogram(**dict(key))
+            with histogram._lock:
+                histogram.counts = [mine + theirs for mine, theirs in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        name = f"{self.prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each stage of a prediction request.",
+            f"# TYPE {name} histogram",
+        ]
+        for key, histogram in sorted(self._histograms.items()):
+            labels = _labels(key)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        seen = set()
+        for (counter, labels), value in sorted(self._counters.items()):
+            full = f"{self.prefix}_{counter}_total"
+            if full not in seen:
+                lines.append(f"# TYPE {full} counter")
+                seen.add(full)
+            suffix = f"{{{_labels(labels)}}}" if labels else ""
+            lines.append(f"{full}{suffix} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
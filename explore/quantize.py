@@ -0,0 +1,192 @@
+"""
+Post-training int8 quantization of the disease CNN, and a comparison of
+the quantized model against the original on held-out images.
+
+Image directories are laid out one sub-folder per class, named like
+DISEASE_CLASSES in config.py (e.g. heldout/Healthy/*.jpg, heldout/Rust/*.jpg).
+
+    python quantize.py convert --calibration data/train --samples 200
+    python quantize.py compare --heldout data/heldout
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import resource
+import time
+
+import numpy as np
+
+from backends import TFLiteModel
+from config import DISEASE_CLASSES, DISEASE_INT8_MODEL_PATH, DISEASE_MODEL_PATH
+from imaging import decode_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def iter_labelled_images(root):
+    """Yields (path, class index) for every image under root/<class>/."""
+    for label, name in enumerate(DISEASE_CLASSES):
+        folder = os.path.join(root, name)
+        if not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(folder, filename), label
+
+
+def load_image(path):
+    with open(path, "rb") as f:
+        return decode_image(f, size=(128, 128))
+
+
+# ===================== CONVERT =====================
+def convert(args):
+    import tensorflow as tf
+
+    paths = [path for path, _ in iter_labelled_images(args.calibration)]
+    if not paths:
+        raise SystemExit(f"No calibration images found under {args.calibration}")
+    rng = np.random.default_rng(0)
+    paths = list(rng.permutation(paths)[: args.samples])
+
+    def representative_dataset():
+        # Activation ranges are calibrated on real leaves, not random noise.
+        for path in paths:
+            yield [load_image(path)[None].astype(np.float32)]
+
+    model = tf.keras.models.load_model(args.model)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    # Keep float input/output so callers pass the same /255.0 arrays.
+    converter.inference_input_type = tf.float32
+    converter.inference_output_type = tf.float32
+
+    start = time.perf_counter()
+    tflite_model = converter.convert()
+    with open(args.output, "wb") as f:
+        f.write(tflite_model)
+    print(
+        f"wrote {args.output} ({len(tflite_model) / 1e6:.2f} MB) from {len(paths)} calibration "
+        f"images in {time.perf_counter() - start:.1f} s"
+    )
+
+
+# ===================== COMPARE =====================
+def rss_mb():
+    """Peak RSS of this process so far."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def load_backend(name, path):
+    if name == "int8":
+        return TFLiteModel(path)
+    import tensorflow as tf
+    return tf.keras.models.load_model(path)
+
+
+def evaluate(name, path, paths, labels, batch_size, results):
+    """
+    Runs in a fresh process per backend, since ru_maxrss is a high-water
+    mark for the whole process: the images are loaded first, and the RSS
+    growth from there on is the backend's alone.
+    """
+    images = np.stack([load_image(image_path) for image_path in paths])
+    before = rss_mb()
+    start = time.perf_counter()
+    model = load_backend(name, path)
+    load_seconds = time.perf_counter() - start
+    model.predict(images[:1], verbose=0)  # warm-up
+
+    single = []
+    for image in images[: min(len(images), 100)]:
+        start = time.perf_counter()
+        model.predict(image[None], verbose=0)
+        single.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    predictions = []
+    for offset in range(0, len(images), batch_size):
+        predictions.append(model.predict(images[offset:offset + batch_size], verbose=0))
+    batched = (time.perf_counter() - start) / len(images)
+    predicted = np.argmax(np.concatenate(predictions), axis=1)
+
+    results.put({
+        "backend": name,
+        "accuracy": float(np.mean(predicted == labels)),
+        "predicted": predicted,
+        "load_s": load_seconds,
+        "p50_ms": float(np.percentile(single, 50) * 1000),
+        "p99_ms": float(np.percentile(single, 99) * 1000),
+        "batched_ms": batched * 1000,
+        "peak_rss_mb": rss_mb(),
+        "rss_growth_mb": rss_mb() - before,
+    })
+
+
+def evaluate_in_process(name, path, paths, labels, batch_size):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=evaluate, args=(name, path, paths, labels, batch_size, results))
+    proc.start()
+    # Read before join(): a child blocks on exit until its queued result is consumed.
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not proc.is_alive():
+                raise SystemExit(f"{name} evaluation failed (exit code {proc.exitcode})")
+    proc.join()
+    return result
+
+
+def compare(args):
+    items = list(iter_labelled_images(args.heldout))
+    if not items:
+        raise SystemExit(f"No held-out images found under {args.heldout}")
+    paths = [path for path, _ in items]
+    labels = np.array([label for _, label in items])
+    print(f"{len(paths)} held-out images")
+
+    # Without tflite-runtime or LiteRT installed, the int8 process imports
+    # TensorFlow for its interpreter and its RSS includes it.
+    int8 = evaluate_in_process("int8", args.int8, paths, labels, args.batch_size)
+    keras = evaluate_in_process("keras", args.model, paths, labels, args.batch_size)
+
+    sizes = {"keras": os.path.getsize(args.model), "int8": os.path.getsize(args.int8)}
+    print(f"{'backend':<8} {'acc':>6} {'p50 ms':>8} {'p99 ms':>8} {'batch ms/img':>13} {'file MB':>8} {'RSS MB':>8} {'RSS +MB':>8} {'load s':>7}")
+    for row in (keras, int8):
+        print(
+            f"{row['backend']:<8} {row['accuracy']:6.3f} {row['p50_ms']:8.2f} {row['p99_ms']:8.2f} "
+            f"{row['batched_ms']:13.2f} {sizes[row['backend']] / 1e6:8.2f} {row['peak_rss_mb']:8.1f} {row['rss_growth_mb']:8.1f} {row['load_s']:7.2f}"
+        )
+    print(f"top-1 agreement int8 vs keras: {np.mean(int8['predicted'] == keras['predicted']):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("convert", help="write an int8 TFLite model")
+    p.add_argument("--model", default=DISEASE_MODEL_PATH)
+    p.add_argument("--output", default=DISEASE_INT8_MODEL_PATH)
+    p.add_argument("--calibration", required=True, help="image folder for activation calibration")
+    p.add_argument("--samples", type=int, default=200)
+    p.set_defaults(func=convert)
+
+    p = sub.add_parser("compare", help="accuracy / latency / memory of keras vs int8")
+    p.add_argument("--model", default=DISEASE_MODEL_PATH)
+    p.add_argument("--int8", default=DISEASE_INT8_MODEL_PATH)
+    p.add_argument("--heldout", required=True, help="labelled held-out image folder")
+    p.add_argument("--batch-size", type=int, default=16)
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import gc
+import os
+import resource
+import threading
+import time
+
+from cache import FileWatch
+
+
+def current_rss_mb():
+    """Resident set size right now (Linux), else the peak so far."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class ModelEntry:
+    """
+    One registered model: how to load it, how to warm it, and its state.
+    """
+
+    def __init__(self, name, loader, warmup=None, path=None, fork_safe=True):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.path = path
+        self.fork_safe = fork_safe
+        self.model = None
+        self.version = 0
+        self.state = "registered"
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.loaded_pid = None
+        self.last_reload = None
+        self.on_swap = []
+        self.lock = threading.Lock()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "ready": self.model is not None,
+            "version": self.version,
+            "error": self.error,
+            "load_ms": None if self.load_seconds is None else round(self.load_seconds * 1000, 1),
+            "warmup_ms": None if self.warmup_seconds is None else round(self.warmup_seconds * 1000, 1),
+            # Differs from the current pid when the model was inherited from a
+            # pre-fork parent and is shared copy-on-write.
+            "loaded_in_pid": self.loaded_pid,
+            "last_reload": self.last_reload,
+        }
+
+
+class ModelRegistry:
+    """
+    Loads models on first use (or at an explicit preload point) instead of at
+    import time, so a worker that only serves crops never imports TensorFlow.
+
+    With pre-fork servers (e.g. gunicorn --preload) call preload_before_fork()
+    in the parent: children inherit the fork-safe models and share those
+    pages. Models registered with fork_safe=False (anything holding
+    TensorFlow runtime state, which does not survive fork()) are never loaded
+    in the parent; each child loads its own copy in the background right
+    after it is forked.
+
+    reload() builds and warms a new version next to the one being served and
+    then swaps the reference. Callers that already fetched the old model via
+    get() finish with it; the old version is freed once they are done.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._watch_interval = 0
+        self._watcher = None
+        self._watcher_pid = None
+        self._after_fork_loads = []
+        self._loading = None
+        self._loading_lock = threading.Lock()
+        self._reloads = {}
+        if hasattr(os, "register_at_fork"):
+            # A lock held by another thread at fork time would stay locked
+            # forever in the child, and the watcher thread does not survive.
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        for entry in self._entries.values():
+            entry.lock = threading.Lock()
+        self._loading_lock = threading.Lock()
+        self._loading = None
+        self._reloads = {}
+        if self._watch_interval:
+            self.watch(self._watch_interval)
+        if self._after_fork_loads:
+            self.load_async(self._after_fork_loads)
+
+    def register(self, name, loader, warmup=None, path=None, fork_safe=True):
+        """
+        `path` is the file to watch for new versions, if any. Pass
+        fork_safe=False for models that must not be loaded before a fork.
+        """
+        self._entries[name] = ModelEntry(name, loader, warmup, path, fork_safe)
+
+    def on_swap(self, name, callback):
+        """Calls `callback()` whenever a new version of `name` is swapped in."""
+        self._entries[name].on_swap.append(callback)
+
+    def names(self):
+        return list(self._entries)
+
+    def get(self, name):
+        entry = self._entries[name]
+        model = entry.model
+        if model is None:
+            self._load(entry)
+            model = entry.model
+        return model
+
+    def _build(self, entry):
+        """Loads and warms a fresh instance without touching the served one."""
+        start = time.perf_counter()
+        model = entry.loader()
+        load_seconds = time.perf_counter() - start
+
+        warmup_seconds = None
+        if entry.warmup is not None:
+            start = time.perf_counter()
+            entry.warmup(model)
+            warmup_seconds = time.perf_counter() - start
+        return model, load_seconds, warmup_seconds
+
+    def _load(self, entry):
+        with entry.lock:
+            if entry.model is not None:
+                return
+            entry.state = "loading"
+            entry.error = None
+            try:
+                model, entry.load_seconds, entry.warmup_seconds = self._build(entry)
+            except Exception as e:
+                entry.state = "failed"
+                entry.error = str(e)
+                raise
+
+            entry.model = model
+            entry.version += 1
+            entry.loaded_pid = os.getpid()
+            entry.state = "ready"
+
+    def reload(self, name):
+        """
+        Loads and warms the current file for `name`, then swaps it in.
+        Returns the reload report. A failed load keeps the old model serving.
+        """
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.model is None:
+                # Never loaded here: the next get() will read the new file anyway.
+                self._notify(entry)
+                return None
+
+            rss_before = current_rss_mb()
+            entry.state = "reloading"
+            start = time.perf_counter()
+            try:
+                model, load_seconds, warmup_seconds = self._build(entry)
+            except Exception as e:
+                entry.state = "ready"
+                entry.error = f"reload failed, still serving version {entry.version}: {e}"
+                raise
+            rss_both = current_rss_mb()
+
+            # A single reference assignment: each request sees old or new, never a mix.
+            entry.model = model
+            entry.version += 1
+            entry.load_seconds, entry.warmup_seconds = load_seconds, warmup_seconds
+            entry.loaded_pid = os.getpid()
+            entry.error = None
+            entry.state = "ready"
+            swap_seconds = time.perf_counter() - start
+
+        del model
+        gc.collect()
+        entry.last_reload = {
+            "version": entry.version,
+            "at": time.time(),
+            "reload_ms": round(swap_seconds * 1000, 1),
+            "load_ms": round(load_seconds * 1000, 1),
+            "warmup_ms": None if warmup_seconds is None else round(warmup_seconds * 1000, 1),
+            "rss_before_mb": round(rss_before, 1),
+            "rss_during_swap_mb": round(rss_both, 1),
+            # The old version is only freed once in-flight requests drop it,
+            # so this can still include it right after the swap.
+            "rss_after_mb": round(current_rss_mb(), 1),
+        }
+        self._notify(entry)
+        return entry.last_reload
+
+    def reload_async(self, name):
+        """Reloads `name` in the background; a reload already running is reused, not repeated."""
+        with self._loading_lock:
+            thread = self._reloads.get(name)
+            if thread is not None and thread.is_alive():
+                return thread
+            thread = threading.Thread(target=self._reload_quietly, args=(name,), name=f"reload-{name}", daemon=True)
+            self._reloads[name] = thread
+            thread.start()
+            return thread
+
+    def _reload_quietly(self, name):
+        try:
+            self.reload(name)
+        except Exception:
+            pass  # recorded in the entry's error field
+
+    def _notify(self, entry):
+        for callback in entry.on_swap:
+            callback()
+
+    def watch(self, interval=2.0):
+        """
+        Starts a background thread that reloads a model whenever its file
+        changes on disk. Safe to call again after fork.
+        """
+        self._watch_interval = interval
+        if not interval or (self._watcher is not None and self._watcher_pid == os.getpid()):
+            return
+        watches = {name: FileWatch(entry.path, interval=0) for name, entry in self._entries.items() if entry.path}
+        self._watcher_pid = os.getpid()
+        self._watcher = threading.Thread(target=self._watch_loop, args=(watches, interval), name="model-watch", daemon=True)
+        self._watcher.start()
+
+    def _watch_loop(self, watches, interval):
+        while True:
+            time.sleep(interval)
+            for name, watch in watches.items():
+                if watch.changed():
+                    self._reload_quietly(name)
+
+    def preload(self, names=None, freeze=True):
+        """
+        Loads and warms the given models (all by default) right now.
+
+        freeze moves everything allocated so far out of the garbage
+        collector's reach, so its passes in forked children do not touch
+        (and therefore copy) the pages holding the models.
+        """
+        for name in self.names() if names is None else names:
+            self.get(name)
+        if freeze and hasattr(gc, "freeze"):
+            gc.collect()
+            gc.freeze()
+
+    def preload_before_fork(self, names=None):
+        """
+        preload() for the parent of a pre-fork server: loads the fork-safe
+        models now and leaves the rest to each child, which starts loading
+        them in the background as soon as it is forked.
+        """
+        names = self.names() if names is None else names
+        self._after_fork_loads = [name for name in names if not self._entries[name].fork_safe]
+        self.preload([name for name in names if self._entries[name].fork_safe])
+
+    def load_async(self, names):
+        """
+        Loads and warms the given models on one background thread, skipping
+        those already loaded. Returns at once; progress shows in status().
+        """
+        with self._loading_lock:
+            if self._loading is not None and self._loading.is_alive():
+                return self._loading
+            pending = [name for name in names if self._entries[name].model is None]
+            if not pending:
+                return None
+            self._loading = threading.Thread(target=self._load_quietly, args=(pending,), name="model-preload", daemon=True)
+            self._loading.start()
+            return self._loading
+
+    def _load_quietly(self, names):
+        for name in names:
+            try:
+                self.get(name)
+            except Exception:
+                pass  # recorded in the entry's error field
+
+    def is_ready(self, name):
+        return self._entries[name].model is not None
+
+    def status(self):
+        return {name: entry.status() for name, entry in self._entries.items()}
@@ -0,0 +1,265 @@
+"""
+Benchmarks for the Streamlit crop recommender and the disease knowledge base.
+
+Run from this directory, e.g.
+
+    python bench.py rerun
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import knowledge
+import recommender
+from forest import compile_forest
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+# ===================== RERUN =====================
+def run_rerun(args):
+    """
+    Times recom.py script runs through Streamlit's AppTest: the first run
+    in a process (cold, with and without an on-disk artifact) and the
+    reruns after it, which is what every slider move costs.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    cache_dir = tempfile.mkdtemp(prefix="recom_cache_")
+    recommender.MODEL_CACHE_DIR = cache_dir
+    try:
+        for label in ("cold, no artifact", "cold, artifact on disk"):
+            # A fresh AppTest still shares st.cache_resource with this process.
+            import streamlit as st
+            st.cache_resource.clear()
+            app = AppTest.from_file("recom.py", default_timeout=120)
+            _, cold = timed(app.run)
+            warm = []
+            for _ in range(args.reruns):
+                _, elapsed = timed(app.run)
+                warm.append(elapsed)
+            warm.sort()
+            source = app.caption[-1].value.split("model ")[1].split(" in")[0]
+            print(
+                f"{label:<24} ({source}) first run {cold * 1000:7.0f} ms   "
+                f"reruns median {warm[len(warm) // 2] * 1000:6.1f} ms"
+            )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+# ===================== LABEL =====================
+def random_features(n_samples, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'N': rng.uniform(0, 200, n_samples).round(1),
+        'P': rng.uniform(0, 150, n_samples).round(1),
+        'K': rng.uniform(0, 250, n_samples).round(1),
+        'rainfall': rng.uniform(100, 400, n_samples).round(1),
+        'humidity': rng.uniform(20, 95, n_samples).round(1),
+        'temperature': rng.uniform(10, 40, n_samples).round(1),
+    })
+
+
+def run_label(args):
+    """
+    Row-wise df.apply(assign_crop_simple) vs label_crops(): equality under
+    the same seed, then throughput of the vectorized labeler on a large set.
+    """
+    df = random_features(args.apply_rows, seed=1)
+    np.random.seed(123)
+    (by_row, apply_seconds) = timed(lambda: df.apply(recommender.assign_crop_simple, axis=1).to_numpy())
+    np.random.seed(123)
+    vectorized, vector_seconds = timed(recommender.label_crops, df)
+    print(
+        f"{args.apply_rows:>11,} rows  apply {apply_seconds:7.2f} s   "
+        f"vectorized {vector_seconds:7.3f} s   identical: {bool((by_row == vectorized).all())}"
+    )
+
+    big = random_features(args.rows, seed=2)
+    labels, seconds = timed(recommender.label_crops, big, np.random.RandomState(0))
+    print(
+        f"{args.rows:>11,} rows  vectorized {seconds:7.2f} s "
+        f"({args.rows / seconds / 1e6:.1f} M rows/s, apply would take ~{apply_seconds / args.apply_rows * args.rows:.0f} s)"
+    )
+    shares = pd.Series(labels).value_counts(normalize=True)
+    print("label shares:", ", ".join(f"{crop} {share:.3f}" for crop, share in shares.head(8).items()))
+
+
+# ===================== PREDICT =====================
+def run_predict(args):
+    """
+    scikit-learn predict_proba vs the compiled forest: single-row latency,
+    batched throughput and whether the probabilities match bit for bit.
+    "walk" is the compiled forest without its model, as loaded from .npz.
+    """
+    # Both sides get plain arrays in training column order.
+    warnings.filterwarnings("ignore", "X does not have valid feature names")
+    model, _ = recommender.load_or_train()
+    compiled, compile_seconds = timed(compile_forest, model)
+    walk = copy.copy(compiled)
+    walk.model = None
+    X = random_features(args.rows, seed=3)[recommender.FEATURE_COLS].to_numpy()
+    print(f"compiled {compiled.n_trees} trees in {compile_seconds * 1000:.1f} ms ({compiled.nbytes / 1e6:.2f} MB of arrays)")
+
+    for name, predict in (
+        ("sklearn", model.predict_proba), ("compiled", compiled.predict_proba), ("walk", walk.predict_proba),
+    ):
+        predict(X[:1])
+        single = []
+        for row in X[:args.singles]:
+            _, elapsed = timed(predict, row[None])
+            single.append(elapsed)
+        _, batch = timed(predict, X)
+        print(
+            f"{name:<9} one row p50 {np.percentile(single, 50) * 1000:7.3f} ms  p99 {np.percentile(single, 99) * 1000:7.3f} ms   "
+            f"{args.rows:,} rows {batch * 1000:7.1f} ms ({args.rows / batch:,.0f} rows/s)"
+        )
+    reference = model.predict_proba(X)
+    print("bit-identical:", all(np.array_equal(reference, forest.predict_proba(X)) for forest in (compiled, walk)))
+
+
+# ===================== LOAD =====================
+def run_load(args):
+    """
+    Plain pd.read_csv vs the chunked dataset loader on a training CSV
+    (optionally tiled to --rows): time, in-memory size and dropped rows.
+    """
+    path = args.csv
+    tmp = None
+    if args.rows:
+        fd, tmp = tempfile.mkstemp(suffix=".csv")
+        with open(args.csv) as src:
+            header, lines = src.readline(), [line.rstrip("\n") + "\n" for line in src]
+        with os.fdopen(fd, "w") as out:
+            out.write(header)
+            for i in range(args.rows):
+                out.write(lines[i % len(lines)])
+        path = tmp
+    try:
+        plain, plain_seconds = timed(pd.read_csv, path)
+        plain = plain.dropna()
+        frame_mb = plain.memory_usage(deep=True).sum() / 1e6
+        print(f"pd.read_csv     {plain_seconds * 1000:8.1f} ms  {len(plain):>10,} rows  {frame_mb:8.2f} MB")
+
+        (X, y, report), seconds = timed(dataset.load_training_arrays, path, recommender.FEATURE_COLS, args.chunksize)
+        arrays_mb = (X.nbytes + y.nbytes) / 1e6
+        print(f"chunked loader  {seconds * 1000:8.1f} ms  {len(X):>10,} rows  {arrays_mb:8.2f} MB (X float32 + labels)")
+        print(f"read {report.rows_read:,}, kept {report.rows_kept:,}, dropped {report.dropped or 'none'}")
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+
+# ===================== DISEASES =====================
+def run_diseases(args):
+    """
+    Load time (parse + freeze + index) and lookup and symptom search latency of the disease
+    knowledge base, on the bundled file grown to --diseases entries by
+    cloning its records under new names and crop lists.
+    """
+    with open(knowledge.DISEASE_DB_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    base = data["diseases"]
+    rng = np.random.default_rng(0)
+    crops = [f"Crop {i}" for i in range(max(args.diseases // 10, 1))]
+    grown = [dict(entry) for entry in base]
+    for i in range(len(base), args.diseases):
+        entry = dict(base[i % len(base)])
+        entry["name"] = f"{entry['name']} {i}"
+        entry["affected_crops"] = list(rng.choice(crops, size=min(4, len(crops)), replace=False))
+        entry["severity_score"] = int(rng.integers(0, 100))
+        grown.append(entry)
+
+    fd, path = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({**data, "diseases": grown}, f, ensure_ascii=False)
+        size_kb = os.path.getsize(path) / 1024
+        loads = []
+        for _ in range(args.loads):
+            kb, elapsed = timed(knowledge.load_knowledge_base, path)
+            loads.append(elapsed)
+    finally:
+        os.remove(path)
+    print(f"{len(kb):,} diseases, {len(kb.crops):,} crops, {size_kb:,.0f} KB: load median {np.median(loads) * 1000:.2f} ms")
+
+    names = list(kb)
+    queries = {
+        "record": (kb.__getitem__, [names[i] for i in rng.integers(0, len(names), args.lookups)]),
+        "by crop": (kb.for_crop, [kb.crops[i] for i in rng.integers(0, len(kb.crops), args.lookups)]),
+        "treatment": (lambda name: kb[name]["solutions"]["organic"], [names[i] for i in rng.integers(0, len(names), args.lookups)]),
+    }
+    for label, (lookup, keys) in queries.items():
+        start = time.perf_counter()
+        for key in keys:
+            lookup(key)
+        per_lookup = (time.perf_counter() - start) / len(keys)
+        print(f"{label:<10} {per_lookup * 1e6:7.2f} µs per lookup")
+    _, seconds = timed(lambda: [kb[name]["emoji"] for name in kb.by_severity])
+    print(f"sidebar listing (all {len(kb):,}, by severity) {seconds * 1000:.2f} ms")
+
+    searches = [
+        "yellow spots with rings on lower leaves", "white powdery coating on leaves",
+        "water-soaked lesions on fruit", "Phytophthora", "brown patches spreading fast in wet weather",
+    ]
+    latencies = []
+    for i in range(args.searches):
+        _, elapsed = timed(kb.search, searches[i % len(searches)])
+        latencies.append(elapsed)
+    print(
+        f"symptom search p50 {np.percentile(latencies, 50) * 1000:.3f} ms  p99 {np.percentile(latencies, 99) * 1000:.3f} ms"
+        f"  (top hit for {searches[0]!r}: {kb.search(searches[0], limit=1)[0][0]})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rerun", help="cold vs warm Streamlit reruns of recom.py")
+    p.add_argument("--reruns", type=int, default=10)
+    p.set_defaults(func=run_rerun)
+
+    p = sub.add_parser("label", help="row-wise apply vs vectorized rule labeler")
+    p.add_argument("--apply-rows", type=int, default=100_000)
+    p.add_argument("--rows", type=int, default=10_000_000)
+    p.set_defaults(func=run_label)
+
+    p = sub.add_parser("predict", help="scikit-learn vs compiled forest inference")
+    p.add_argument("--rows", type=int, default=10_000)
+    p.add_argument("--singles", type=int, default=200)
+    p.set_defaults(func=run_predict)
+
+    p = sub.add_parser("load", help="pd.read_csv vs the chunked, validated CSV loader")
+    p.add_argument("--csv", default="cd.csv")
+    p.add_argument("--rows", type=int, default=0, help="tile the file to this many rows first")
+    p.add_argument("--chunksize", type=int, default=50_000)
+    p.set_defaults(func=run_load)
+
+    p = sub.add_parser("diseases", help="disease knowledge base load, lookup and search cost")
+    p.add_argument("--diseases", type=int, default=500, help="grow the bundled file to this many entries")
+    p.add_argument("--loads", type=int, default=5)
+    p.add_argument("--lookups", type=int, default=100_000)
+    p.add_argument("--searches", type=int, default=2000)
+    p.set_defaults(func=run_diseases)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
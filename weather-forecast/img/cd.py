@@ -8,9 +8,13 @@ Final Year Academic Project
 import streamlit as st
 from PIL import Image
 import numpy as np
-import random
+import pandas as pd
 import time
 
+from diagnosis import HEALTHY_CLASS, HEALTHY_INFO, DiseaseModelResource, ModelUnavailable, diagnose, diagnose_many
+from knowledge import load_knowledge_base
+from voice import WELCOME_TEXT, VoiceAssistant, speech_texts
+
 # ==========================================
 # PAGE CONFIGURATION
 # ==========================================
@@ -22,39 +26,19 @@ st.set_page_config(
 )
 
 # ==========================================
-# TEXT-TO-SPEECH FUNCTION (SIMPLIFIED)
+# VOICE ASSISTANT PLAYBACK
 # ==========================================
-def speak_text(text):
-    """Convert text to speech and play it"""
-    try:
-        # Try to import pyttsx3
-        import pyttsx3
-        
-        # Initialize the engine
-        engine = pyttsx3.init()
-        
-        # Set properties
-        engine.setProperty('rate', 150)  # Speed
-        engine.setProperty('volume', 0.9)  # Volume
-        
-        # Get available voices
-        voices = engine.getProperty('voices')
-        
-        # Try to use a female voice if available
-        for voice in voices:
-            if 'female' in voice.name.lower():
-                engine.setProperty('voice', voice.id)
-                break
-        
-        # Speak the text
-        engine.say(text)
-        engine.runAndWait()
-        
+def play_speech(text):
+    """Play pre-rendered speech; never waits for the speech engine"""
+    audio_path = voice_assistant.audio(text)
+    if audio_path:
+        st.audio(audio_path, format="audio/wav")
         return True
-    except Exception as e:
-        # If pyttsx3 fails, show a message
-        st.warning(f"Voice feature unavailable. Please install pyttsx3 with: pip install pyttsx3")
-        return False
+    if voice_assistant.error:
+        st.warning(voice_assistant.error)
+    else:
+        st.info("🔄 Preparing audio... press again in a moment.")
+    return False
 
 # ==========================================
 # CUSTOM CSS STYLING
@@ -241,196 +225,48 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ==========================================
-# ENHANCED DISEASE DATABASE WITH MULTIPLE SOLUTIONS
+# DISEASE KNOWLEDGE BASE (diseases.json, loaded once per server)
 # ==========================================
-DISEASE_DATABASE = {
-    "Early Blight": {
-        "scientific_name": "Alternaria solani",
-        "description": "A fungal disease characterized by dark concentric rings on leaves, affecting tomatoes and potatoes.",
-        "affected_crops": ["Tomato", "Potato", "Eggplant", "Pepper"],
-        "symptoms": [
-            "Small dark spots on lower leaves",
-            "Concentric rings on lesions",
-            "Yellowing around spots",
-            "Leaf drop in severe cases",
-            "Lesions on stems and fruits"
-        ],
-        "severity": "Moderate-High",
-        "severity_score": 65,
-        "solutions": {
-            "chemical": [
-                "Apply Chlorothalonil (Bravo) every 7-10 days",
-                "Use Mancozeb (Dithane) as preventative spray",
-                "Apply Copper-based fungicides (Kocide)"
-            ],
-            "organic": [
-                "Spray neem oil solution every 5-7 days",
-                "Apply baking soda solution (1 tbsp per gallon of water)",
-                "Use garlic extract spray"
-            ],
-            "cultural": [
-                "Practice 3-year crop rotation",
-                "Remove and destroy infected plant debris",
-                "Ensure proper spacing (60-90 cm between plants)",
-                "Water at soil level, avoid overhead irrigation",
-                "Use mulch to prevent soil splash"
-            ],
-            "biological": [
-                "Apply Trichoderma harzianum bio-fungicide",
-                "Use Bacillus subtilis products",
-                "Introduce beneficial microbes to soil"
-            ]
-        },
-        "prevention": [
-            "Use disease-resistant varieties",
-            "Plant in well-drained soil",
-            "Avoid working with wet plants",
-            "Sanitize garden tools regularly",
-            "Monitor plants weekly for early signs"
-        ],
-        "emoji": "🍅"
-    },
-    "Late Blight": {
-        "scientific_name": "Phytophthora infestans",
-        "description": "Devastating disease that spreads rapidly in cool, wet conditions, famous for causing the Irish Potato Famine.",
-        "affected_crops": ["Potato", "Tomato"],
-        "symptoms": [
-            "Water-soaked lesions on leaves",
-            "White mold growth on underside of leaves",
-            "Rapid spreading in wet conditions",
-            "Dark lesions on stems",
-            "Rotting of tubers and fruits"
-        ],
-        "severity": "Very High",
-        "severity_score": 90,
-        "solutions": {
-            "chemical": [
-                "Apply Metalaxyl (Ridomil) as soil drench",
-                "Use Chlorothalonil (Bravo) every 5-7 days during wet weather",
-                "Apply Famoxadone + Cymoxanil (Tanos)"
-            ],
-            "organic": [
-                "Apply copper fungicides every 7-10 days",
-                "Use hydrogen peroxide spray (3% solution)",
-                "Apply compost tea to boost plant immunity"
-            ],
-            "cultural": [
-                "Destroy infected plants immediately",
-                "Use certified disease-free seeds",
-                "Avoid overhead irrigation",
-                "Improve air circulation",
-                "Harvest before rainy season"
-            ],
-            "biological": [
-                "Apply Streptomyces lydicus products",
-                "Use Bacillus amyloliquefaciens",
-                "Apply chitosan-based products"
-            ]
-        },
-        "prevention": [
-            "Plant resistant varieties",
-            "Monitor weather forecasts",
-            "Use protective fungicides before rainy periods",
-            "Avoid planting near infected fields",
-            "Practice strict sanitation"
-        ],
-        "emoji": "🥔"
-    },
-    "Powdery Mildew": {
-        "scientific_name": "Erysiphe spp.",
-        "description": "White powdery fungal growth on leaves and stems, common in dry conditions with high humidity.",
-        "affected_crops": ["Cucumber", "Squash", "Grapes", "Wheat", "Mango", "Rose"],
-        "symptoms": [
-            "White powdery spots on leaves",
-            "Leaves turning yellow then brown",
-            "Stunted plant growth",
-            "Distorted leaves",
-            "Reduced fruit production"
-        ],
-        "severity": "Moderate",
-        "severity_score": 50,
-        "solutions": {
-            "chemical": [
-                "Apply Sulfur dust or spray",
-                "Use Myclobutanil (Systhane) every 10-14 days",
-                "Apply Triflumizole (Procure)"
-            ],
-            "organic": [
-                "Spray milk solution (1 part milk to 9 parts water)",
-                "Apply baking soda spray (1 tsp per liter)",
-                "Use neem oil every 5-7 days",
-                "Apply potassium bicarbonate solution"
-            ],
-            "cultural": [
-                "Ensure good air circulation",
-                "Avoid overhead watering",
-                "Plant resistant varieties",
-                "Remove infected leaves promptly",
-                "Space plants properly"
-            ],
-            "biological": [
-                "Apply Ampelomyces quisqualis",
-                "Use Bacillus pumilus products",
-                "Apply horticultural oil sprays"
-            ]
-        },
-        "prevention": [
-            "Water early in the day",
-            "Maintain proper plant spacing",
-            "Avoid excess nitrogen fertilizer",
-            "Keep garden clean of debris",
-            "Monitor humidity levels"
-        ],
-        "emoji": "🍃"
-    },
-    "Bacterial Leaf Spot": {
-        "scientific_name": "Xanthomonas spp.",
-        "description": "Bacterial disease causing angular water-soaked spots that turn brown with yellow halos.",
-        "affected_crops": ["Tomato", "Pepper", "Cabbage", "Rice", "Mango", "Citrus"],
-        "symptoms": [
-            "Small water-soaked spots",
-            "Spots turning brown or black",
-            "Yellow halos around spots",
-            "Leaf drop in severe cases",
-            "Fruit lesions and spots"
-        ],
-        "severity": "Moderate",
-        "severity_score": 55,
-        "solutions": {
-            "chemical": [
-                "Apply Copper-based bactericides (Kocide 3000)",
-                "Use Streptomycin for severe cases",
-                "Apply Oxytetracycline products"
-            ],
-            "organic": [
-                "Apply copper soap sprays",
-                "Use hydrogen peroxide (3%) solution",
-                "Apply garlic-chili spray",
-                "Use vinegar solution (1:3 vinegar:water)"
-            ],
-            "cultural": [
-                "Use disease-free seeds and transplants",
-                "Avoid working with wet plants",
-                "Practice 2-3 year crop rotation",
-                "Remove weed hosts",
-                "Disinfect tools regularly"
-            ],
-            "biological": [
-                "Apply Bacillus subtilis products",
-                "Use Pseudomonas fluorescens",
-                "Apply beneficial microbes"
-            ]
-        },
-        "prevention": [
-            "Purchase certified disease-free seeds",
-            "Avoid overhead irrigation",
-            "Remove infected plants immediately",
-            "Control insect vectors",
-            "Improve soil drainage"
-        ],
-        "emoji": "🦠"
-    }
-}
+@st.cache_resource(show_spinner=False)
+def get_knowledge_base():
+    return load_knowledge_base()
+
+DISEASE_DATABASE = get_knowledge_base()
+
+# ==========================================
+# DISEASE MODEL (one per server, warmed in the background)
+# ==========================================
+@st.cache_resource(show_spinner=False)
+def get_disease_model():
+    return DiseaseModelResource()
+
+disease_model = get_disease_model()
+
+# ==========================================
+# VOICE ASSISTANT (one speech engine per server, clips cached on disk)
+# ==========================================
+@st.cache_resource(show_spinner=False)
+def get_voice_assistant():
+    assistant = VoiceAssistant()
+    assistant.prerender([WELCOME_TEXT])
+    for name, info in [*DISEASE_DATABASE.items(), (HEALTHY_CLASS, HEALTHY_INFO)]:
+        assistant.prerender(speech_texts(name, info).values())
+    return assistant
+
+voice_assistant = get_voice_assistant()
+
+# ==========================================
+# FIELD SURVEY TABLE
+# ==========================================
+def survey_table(rows):
+    """Survey result rows as a table for st.dataframe (sortable by any column)"""
+    return pd.DataFrame(rows).rename(columns={
+        "image": "Image",
+        "disease": "Disease",
+        "confidence": "Confidence (%)",
+        "severity": "Severity",
+        "severity_score": "Severity Score",
+    })
 
 # ==========================================
 # INITIALIZE SESSION STATE
@@ -439,6 +275,8 @@ if 'current_page' not in st.session_state:
     st.session_state.current_page = 'Detection'  # Default to detection page
 if 'last_analysis' not in st.session_state:
     st.session_state.last_analysis = None
+if 'survey_results' not in st.session_state:
+    st.session_state.survey_results = []
 
 # ==========================================
 # SIDEBAR - SIMPLE NAVIGATION
@@ -459,11 +297,22 @@ with st.sidebar:
     st.markdown("### 🔊 Voice Assistant")
     
     if st.button("🎤 Test Voice Assistant", use_container_width=True):
-        test_message = "Welcome to the Crop Disease Detection System. I am your voice assistant. I will help you understand the disease detection results."
-        if speak_text(test_message):
+        if play_speech(WELCOME_TEXT):
             st.success("Voice assistant is working!")
-        else:
-            st.warning("Please install pyttsx3: pip install pyttsx3")
+    if voice_assistant.pending:
+        st.caption(f"🔄 Preparing {voice_assistant.pending} voice clips...")
+    
+    st.markdown("---")
+    
+    # AI Model Status
+    st.markdown("### 🧠 AI Model")
+    if disease_model.ready:
+        st.success(f"Ready · loaded in {disease_model.load_seconds:.1f} s, "
+                   f"warm-up {disease_model.warmup_seconds * 1000:.0f} ms")
+    elif disease_model.state == "failed":
+        st.error(f"Unavailable: {disease_model.error}")
+    else:
+        st.info("⏳ Model warming up... you can upload images meanwhile.")
     
     st.markdown("---")
     
@@ -481,10 +330,11 @@ with st.sidebar:
     # Disease Statistics
     st.markdown("### 📊 Disease Database")
     st.metric("Total Diseases", len(DISEASE_DATABASE))
+    st.caption(f"Database version {DISEASE_DATABASE.version} · {len(DISEASE_DATABASE.crops)} crops covered")
     
-    # List available diseases
+    # List available diseases, most severe first
     st.markdown("**Available Diseases:**")
-    for disease in DISEASE_DATABASE.keys():
+    for disease in DISEASE_DATABASE.by_severity:
         st.markdown(f"- {DISEASE_DATABASE[disease]['emoji']} {disease}")
 
 # ==========================================
@@ -512,6 +362,27 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Symptom Search
+symptom_query = st.text_input(
+    "🔎 No photo? Describe what you see on the leaves:",
+    placeholder="e.g. yellow spots with rings on lower leaves"
+)
+if symptom_query:
+    search_start = time.perf_counter()
+    matches = DISEASE_DATABASE.search(symptom_query)
+    search_ms = (time.perf_counter() - search_start) * 1000
+    if matches:
+        for rank, (disease, score) in enumerate(matches):
+            info = DISEASE_DATABASE[disease]
+            with st.expander(f"{info['emoji']} {disease} ({info['scientific_name']})", expanded=rank == 0):
+                st.write(info['description'])
+                for symptom in info['symptoms'][:4]:
+                    st.write(f"• {symptom}")
+                st.caption(f"Severity: {info['severity']} · relevance {score:.2f}")
+        st.caption(f"🔎 {len(matches)} candidate diseases in {search_ms:.2f} ms")
+    else:
+        st.info("No disease in the database matches that description. Try other words, or upload a photo.")
+
 # Upload Section
 st.markdown("""
 <div class="upload-container">
@@ -525,12 +396,63 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# File Uploader
-uploaded_file = st.file_uploader(
-    "Choose a leaf image...",
-    type=["jpg", "jpeg", "png"],
+# Analysis Mode
+survey_mode = st.radio(
+    "Analysis mode",
+    ["🖼️ Single image", "🗂️ Field survey (many images)"],
+    horizontal=True,
     label_visibility="collapsed"
-)
+) != "🖼️ Single image"
+
+# File Uploader
+if survey_mode:
+    uploaded_file = None
+    survey_files = st.file_uploader(
+        "Choose leaf images...",
+        type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True,
+        label_visibility="collapsed"
+    )
+else:
+    uploaded_file = st.file_uploader(
+        "Choose a leaf image...",
+        type=["jpg", "jpeg", "png"],
+        label_visibility="collapsed"
+    )
+
+# Process Field Survey
+if survey_mode:
+    if survey_files and st.button(f"🔬 Analyze {len(survey_files)} Images with AI", type="primary", use_container_width=True):
+        try:
+            progress_bar = st.progress(0, text="Starting..." if disease_model.ready else "⏳ Model warming up...")
+            table = st.empty()
+            model = disease_model.wait()
+
+            # Rows appear batch by batch; only a batch or two of images is decoded at a time
+            rows = []
+            for batch_rows in diagnose_many(survey_files, model, DISEASE_DATABASE):
+                rows.extend(batch_rows)
+                progress_bar.progress(len(rows) / len(survey_files), text=f"{len(rows)} of {len(survey_files)} images analyzed")
+                table.dataframe(survey_table(rows), use_container_width=True, hide_index=True)
+            st.session_state.survey_results = rows
+            table.empty()
+        except ModelUnavailable as e:
+            st.error(f"⚠️ {e}")
+
+    if st.session_state.survey_results:
+        rows = st.session_state.survey_results
+        st.markdown("### 🗂️ Field Survey Results")
+        st.caption("Click a column header to sort.")
+        st.dataframe(survey_table(rows), use_container_width=True, hide_index=True)
+
+        counts = pd.Series([row["disease"] or "Unreadable" for row in rows]).value_counts()
+        count_cols = st.columns(len(counts))
+        for col, (disease, count) in zip(count_cols, counts.items()):
+            col.metric(disease, f"{count} ({count / len(rows):.0%})")
+
+        if st.button("🔄 Start a New Survey", use_container_width=True):
+            st.session_state.survey_results = []
+            st.rerun()
 
 # Process Uploaded Image
 if uploaded_file is not None:
@@ -547,7 +469,7 @@ if uploaded_file is not None:
         st.markdown("### 🌾 Select Crop Type")
         crop_type = st.selectbox(
             "Choose the crop type for better accuracy:",
-            ["Auto Detect", "Tomato", "Potato", "Rice", "Banana", "Cucumber", "Wheat", "Grapes", "Other"],
+            ["Auto Detect", *DISEASE_DATABASE.crops, "Other"],
             index=0
         )
         
@@ -557,16 +479,19 @@ if uploaded_file is not None:
         with col2:
             if st.button("🔬 Analyze Image with AI", type="primary", use_container_width=True):
                 with st.spinner("🔄 AI is analyzing the image... Please wait."):
-                    # Show progress
-                    progress_bar = st.progress(0)
-                    for i in range(100):
-                        time.sleep(0.02)
-                        progress_bar.progress(i + 1)
-                    
-                    # Get random disease prediction (for demo)
-                    disease_name = random.choice(list(DISEASE_DATABASE.keys()))
-                    disease_info = DISEASE_DATABASE[disease_name]
-                    confidence = random.randint(88, 97)
+                    # Only the first analyses after a restart can find the model still warming
+                    progress_bar = st.progress(0, text="Starting..." if disease_model.ready else "⏳ Model warming up...")
+                    model = disease_model.wait()
+
+                    # Progress follows the real pipeline stages
+                    analysis = diagnose(
+                        uploaded_file.getvalue(), model, DISEASE_DATABASE,
+                        on_stage=lambda stage, done: progress_bar.progress(done, text=f"{stage.title()} done"),
+                        crop=crop_type if crop_type in DISEASE_DATABASE.by_crop else None,
+                    )
+                    disease_name = analysis["disease_name"]
+                    disease_info = analysis["disease_info"]
+                    confidence = analysis["confidence"]
                     
                     # Store analysis in session state
                     st.session_state.last_analysis = {
@@ -575,15 +500,12 @@ if uploaded_file is not None:
                         "confidence": confidence
                     }
                     
-                    # Complete progress
-                    progress_bar.progress(100)
-                    time.sleep(0.5)
-                    
                     # DISPLAY RESULTS
                     st.markdown('<div class="result-card">', unsafe_allow_html=True)
                     
                     # Title
                     st.markdown('<h2 style="color: #2E7D32; margin-bottom: 1.5rem;">✅ Analysis Complete!</h2>', unsafe_allow_html=True)
+                    st.caption("⏱️ " + " · ".join(f"{stage} {ms:.0f} ms" for stage, ms in analysis["timings"].items()))
                     
                     # Emoji
                     st.markdown(f'<div style="font-size: 4rem; margin: 1rem 0;">{disease_info["emoji"]}</div>', unsafe_allow_html=True)
@@ -658,12 +580,14 @@ if uploaded_file is not None:
                         with prevention_cols[i % 2]:
                             st.info(f"✓ {tip}")
         
+    except ModelUnavailable as e:
+        st.error(f"⚠️ {e}")
     except Exception as e:
         st.error(f"Error processing image: {str(e)}")
         st.info("Please upload a valid image file.")
 
 # Show analysis results if available
-if st.session_state.last_analysis:
+if st.session_state.last_analysis and not survey_mode:
     disease_name = st.session_state.last_analysis["disease_name"]
     disease_info = st.session_state.last_analysis["disease_info"]
     confidence = st.session_state.last_analysis["confidence"]
@@ -673,42 +597,19 @@ if st.session_state.last_analysis:
     st.markdown("### 🔊 Voice Assistant")
     col1, col2, col3 = st.columns(3)
     
+    voice_texts = speech_texts(disease_name, disease_info)
+    
     with col1:
         if st.button("🎤 Hear Diagnosis", key="hear_diagnosis", use_container_width=True):
-            voice_text = f"Disease detected: {disease_name}. Confidence level: {confidence} percent. Severity: {disease_info['severity']}. This disease affects: {', '.join(disease_info['affected_crops'])}."
-            if speak_text(voice_text):
-                st.success("Playing diagnosis...")
+            play_speech(voice_texts["diagnosis"])
     
     with col2:
         if st.button("💊 Hear Treatments", key="hear_treatments", use_container_width=True):
-            if disease_info['solutions']['chemical']:
-                chemical_treatment = disease_info['solutions']['chemical'][0]
-            else:
-                chemical_treatment = "Consult agricultural expert"
-            
-            if disease_info['solutions']['organic']:
-                organic_treatment = disease_info['solutions']['organic'][0]
-            else:
-                organic_treatment = "Use neem oil spray"
-            
-            voice_text = f"Recommended treatments. Chemical treatment: {chemical_treatment}. Organic option: {organic_treatment}."
-            if speak_text(voice_text):
-                st.success("Playing treatments...")
+            play_speech(voice_texts["treatments"])
     
     with col3:
         if st.button("🛡️ Hear Prevention", key="hear_prevention", use_container_width=True):
-            if disease_info['prevention']:
-                prevention1 = disease_info['prevention'][0]
-                if len(disease_info['prevention']) > 1:
-                    prevention2 = disease_info['prevention'][1]
-                    voice_text = f"Prevention tips: {prevention1}. Also remember to: {prevention2}."
-                else:
-                    voice_text = f"Prevention tip: {prevention1}."
-            else:
-                voice_text = "Practice crop rotation and monitor plants regularly."
-            
-            if speak_text(voice_text):
-                st.success("Playing prevention tips...")
+            play_speech(voice_texts["prevention"])
     
     # Download Report and Analyze Another
     st.markdown("---")
@@ -722,7 +623,7 @@ if st.session_state.last_analysis:
         if st.button("🔄 Analyze Another Image", type="primary", use_container_width=True):
             st.session_state.last_analysis = None
             st.rerun()
-else:
+elif not st.session_state.survey_results or not survey_mode:
     # Show sample images when no file is uploaded
     st.markdown("""
     <div class="card">
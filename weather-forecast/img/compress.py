@@ -0,0 +1,197 @@
+"""
+Compression of the crop forest in recommender.py into smaller models, and a
+report of what each one costs and how often it agrees with the original.
+
+Candidates:
+    pruned-A    the original's trees, keeping only those that move the
+                forest's answer: trees are ordered greedily by how much they
+                bring the running average towards the full forest, and the
+                shortest prefix with top-1 agreement >= A is kept
+    leaves-N    a forest refitted on the training rows with at most N leaves
+                per tree
+    distil-*    a small regression forest or one tree fitted to the full
+                forest's class probabilities (soft labels) over the training
+                rows plus random points across the slider ranges
+
+Every candidate is compiled and measured the way recom.py serves it.
+
+    python compress.py
+    python compress.py --targets 0.98,0.995 --out compressed/
+"""
+import argparse
+import copy
+import io
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+import recommender
+from forest import CompiledForest, compile_forest
+
+
+def uniform_points(n_samples, seed):
+    """Random inputs across the recom.py slider ranges."""
+    rng = np.random.default_rng(seed)
+    low, high = np.array([recommender.FEATURE_RANGES[name] for name in recommender.FEATURE_COLS]).T
+    return rng.uniform(low, high, (n_samples, len(low))).astype(np.float32)
+
+
+# ===================== CANDIDATES =====================
+def order_trees(model, X, stop_at):
+    """
+    Ordered aggregation: repeatedly add the tree that brings the running
+    average closest to the full forest's top-1 answers on X. Returns the
+    tree order and the agreement after each step, stopping once agreement
+    reaches `stop_at`; trees never picked add nothing there.
+    """
+    compiled = compile_forest(model)
+    per_tree = compiled.leaf_proba[compiled._leaves(X)].astype(np.float32)  # (trees, rows, classes)
+    reference = per_tree.mean(axis=0).argmax(axis=1)
+
+    order, agreements = [], []
+    total = np.zeros(per_tree.shape[1:], dtype=np.float32)
+    remaining = list(range(len(per_tree)))
+    while remaining:
+        candidates = total[None] + per_tree[remaining]
+        agreement = (candidates.argmax(axis=2) == reference).mean(axis=1)
+        best = int(np.argmax(agreement))
+        order.append(remaining.pop(best))
+        agreements.append(float(agreement[best]))
+        total = candidates[best]
+        if agreements[-1] >= stop_at:
+            break
+    return order, agreements
+
+
+def prune_trees(model, order, agreements, target):
+    """The shortest prefix of `order` reaching `target` agreement."""
+    reached = [i for i, agreement in enumerate(agreements) if agreement >= target]
+    keep = order[:reached[0] + 1] if reached else order
+    pruned = copy.copy(model)
+    pruned.estimators_ = [model.estimators_[i] for i in keep]
+    pruned.n_estimators = len(keep)
+    return pruned
+
+
+def leaf_limited(df, max_leaves, n_estimators):
+    params = {**recommender.MODEL_PARAMS, "n_estimators": n_estimators, "max_leaf_nodes": max_leaves}
+    return RandomForestClassifier(**params).fit(df[recommender.FEATURE_COLS], df['label'])
+
+
+def distil(teacher, X, student):
+    """Fits `student` (a regressor) to the teacher's class probabilities on X."""
+    return student.fit(X, teacher.predict_proba(X))
+
+
+# ===================== MEASURE =====================
+def measure(name, compiled, fitted, X_eval, reference, labels, X_labelled):
+    """`reference` is the full forest's predict_proba on X_eval (same class order)."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "model.npz")
+        compiled.save(path)
+        npz_bytes = os.path.getsize(path)
+        start = time.perf_counter()
+        CompiledForest.load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+
+    buffer = io.BytesIO()
+    joblib.dump(fitted, buffer)
+    joblib_bytes = buffer.getbuffer().nbytes
+
+    compiled.predict_proba(X_eval[:1])
+    single = []
+    for row in X_eval[:300]:
+        start = time.perf_counter()
+        compiled.predict_proba(row[None])
+        single.append(time.perf_counter() - start)
+
+    proba = compiled.predict_proba(X_eval)
+    return {
+        "name": name,
+        "trees": compiled.n_trees,
+        "nodes": len(compiled.feature),
+        "npz_kb": npz_bytes / 1024,
+        "joblib_kb": joblib_bytes / 1024,
+        "load_ms": load_ms,
+        "predict_ms": float(np.median(single) * 1000),
+        "agreement": float(np.mean(proba.argmax(axis=1) == reference.argmax(axis=1))),
+        # Total variation distance to the full forest's probabilities, 0 = identical.
+        "proba_tv": float(0.5 * np.abs(proba - reference).sum(axis=1).mean()),
+        "train_acc": float(np.mean(compiled.predict(X_labelled) == labels)),
+    }
+
+
+def print_report(results):
+    full = results[0]
+    print(f"{'model':<14} {'trees':>5} {'nodes':>7} {'npz KB':>8} {'joblib KB':>9} {'load ms':>8} "
+          f"{'pred ms':>8} {'agree':>6} {'prob TV':>7} {'train acc':>9} {'size':>6}")
+    for r in results:
+        print(
+            f"{r['name']:<14} {r['trees']:>5} {r['nodes']:>7} {r['npz_kb']:8.0f} {r['joblib_kb']:9.0f} "
+            f"{r['load_ms']:8.2f} {r['predict_ms']:8.3f} {r['agreement']:6.3f} {r['proba_tv']:7.3f} {r['train_acc']:9.3f} "
+            f"{r['npz_kb'] / full['npz_kb']:6.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default="0.95,0.98,0.99", help="top-1 agreements for the pruned forests")
+    parser.add_argument("--prune-samples", type=int, default=4000, help="rows the tree ordering is scored on")
+    parser.add_argument("--max-leaves", default="16,32", help="comma-separated leaf limits to refit with")
+    parser.add_argument("--leaf-trees", type=int, default=50)
+    parser.add_argument("--distil-samples", type=int, default=20_000)
+    parser.add_argument("--eval-samples", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=recommender.SEED)
+    parser.add_argument("--out", help="write each candidate's compiled .npz into this directory")
+    args = parser.parse_args()
+
+    df = recommender.base_dataset()
+    teacher, _ = recommender.load_or_train(df)
+    X_train = df[recommender.FEATURE_COLS].to_numpy(dtype=np.float32)
+    labels = df['label'].to_numpy()
+    classes = teacher.classes_
+
+    # Separate draws for fitting (pruning, distillation) and for scoring agreement.
+    X_fit = np.vstack([X_train, uniform_points(args.distil_samples, args.seed)])
+    X_eval = uniform_points(args.eval_samples, args.seed + 1)
+    reference = compile_forest(teacher).predict_proba(X_eval)
+
+    candidates = [("full", teacher, None)]
+    start = time.perf_counter()
+    targets = sorted(float(value) for value in args.targets.split(",") if value)
+    rng = np.random.default_rng(args.seed)
+    X_prune = X_fit[rng.permutation(len(X_fit))[:args.prune_samples]]
+    order, agreements = order_trees(teacher, X_prune, stop_at=targets[-1])
+    for target in targets:
+        candidates.append((f"pruned-{target:g}", prune_trees(teacher, order, agreements, target), None))
+    for max_leaves in (int(value) for value in args.max_leaves.split(",") if value):
+        candidates.append((f"leaves-{max_leaves}", leaf_limited(df, max_leaves, args.leaf_trees), None))
+    candidates.append((
+        "distil-forest",
+        distil(teacher, X_fit, RandomForestRegressor(n_estimators=10, max_leaf_nodes=128, random_state=args.seed)),
+        classes,
+    ))
+    candidates.append((
+        "distil-tree",
+        distil(teacher, X_fit, DecisionTreeRegressor(max_leaf_nodes=256, random_state=args.seed)),
+        classes,
+    ))
+    print(f"built {len(candidates) - 1} candidates in {time.perf_counter() - start:.1f} s\n")
+
+    results = []
+    for name, fitted, soft_classes in candidates:
+        compiled = compile_forest(fitted, soft_classes)
+        results.append(measure(name, compiled, fitted, X_eval, reference, labels, X_train))
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+            compiled.save(os.path.join(args.out, f"crop_{name}.npz"))
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Chunked, validated loader for the crop training CSVs (cd.csv):
+
+    N,P,K,temperature,humidity,ph,rainfall,label
+
+Rows are read a chunk at a time, checked against SCHEMA and stored in
+compact dtypes (int16 nutrients, float32 climate and pH), so a large file
+never exists as one float64 DataFrame; only one chunk at a time does.
+Malformed rows, including lines with the wrong number of fields, are
+dropped and counted instead of failing the whole load.
+"""
+import warnings
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+# column -> (dtype, min, max), inclusive bounds
+SCHEMA = {
+    'N': (np.int16, 0, 1000),
+    'P': (np.int16, 0, 1000),
+    'K': (np.int16, 0, 1000),
+    'temperature': (np.float32, -20.0, 60.0),
+    'humidity': (np.float32, 0.0, 100.0),
+    'ph': (np.float32, 0.0, 14.0),
+    'rainfall': (np.float32, 0.0, 5000.0),
+}
+LABEL_COL = 'label'
+
+
+@dataclass
+class LoadReport:
+    rows_read: int = 0
+    rows_kept: int = 0
+    dropped: dict = field(default_factory=dict)
+
+    def drop(self, reason, count):
+        if count:
+            self.dropped[reason] = self.dropped.get(reason, 0) + int(count)
+
+
+def _check_header(path):
+    header = pd.read_csv(path, nrows=0).columns.str.strip()
+    missing = [col for col in list(SCHEMA) + [LABEL_COL] if col not in header]
+    if missing:
+        raise ValueError(f"{path}: missing columns {missing}")
+
+
+def _clean_chunk(chunk, report):
+    """Coerces, validates and downcasts one raw chunk."""
+    chunk.columns = chunk.columns.str.strip()
+    report.rows_read += len(chunk)
+    keep = np.ones(len(chunk), dtype=bool)
+    columns = {}
+
+    for col, (dtype, low, high) in SCHEMA.items():
+        values = chunk[col]
+        if not pd.api.types.is_numeric_dtype(values):
+            values = pd.to_numeric(values, errors='coerce')
+        values = values.to_numpy(dtype=np.float64)
+        bad = np.isnan(values)
+        report.drop(f"{col}: missing or not a number", (bad & keep).sum())
+        keep &= ~bad
+
+        out_of_range = ~bad & ((values < low) | (values > high))
+        report.drop(f"{col}: outside [{low}, {high}]", (out_of_range & keep).sum())
+        keep &= ~out_of_range
+
+        if np.issubdtype(dtype, np.integer):
+            fractional = ~bad & (values != np.round(values))
+            report.drop(f"{col}: not a whole number", (fractional & keep).sum())
+            keep &= ~fractional
+        columns[col] = values
+
+    labels = chunk[LABEL_COL].astype(object).str.strip().str.lower()
+    no_label = labels.isna().to_numpy() | (labels == '').to_numpy()
+    report.drop("label: missing", (no_label & keep).sum())
+    keep &= ~no_label
+
+    cleaned = pd.DataFrame({
+        col: columns[col][keep].astype(dtype) for col, (dtype, _, _) in SCHEMA.items()
+    })
+    cleaned[LABEL_COL] = labels.to_numpy()[keep].astype(object)
+    report.rows_kept += len(cleaned)
+    return cleaned
+
+
+def _next_chunk(reader, report):
+    """
+    The reader's next chunk (None at the end), counting the lines it skipped
+    for having the wrong number of fields. A callable on_bad_lines would
+    need the python engine, many times slower than the C one, so the C
+    engine's "Skipping line N" warnings are counted instead.
+    """
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        chunk = next(reader, None)
+    for warning in caught:
+        message = str(warning.message)
+        if issubclass(warning.category, pd.errors.ParserWarning) and "Skipping line" in message:
+            skipped = message.count("Skipping line")
+            report.rows_read += skipped
+            report.drop("wrong number of fields", skipped)
+        else:
+            # Anything else is not ours to swallow.
+            warnings.warn_explicit(
+                warning.message, warning.category, warning.filename, warning.lineno
+            )
+    return chunk
+
+
+def iter_clean_chunks(path, chunksize=50_000, report=None):
+    """Yields validated DataFrames of at most `chunksize` rows."""
+    _check_header(path)
+    report = report if report is not None else LoadReport()
+    reader = pd.read_csv(
+        path,
+        chunksize=chunksize,
+        # No dtype here: a stray text cell only turns its column in that
+        # chunk into object, which _clean_chunk coerces, instead of failing.
+        dtype={LABEL_COL: object},
+        skip_blank_lines=True,
+        on_bad_lines='warn',
+        skipinitialspace=True,
+    )
+    while (chunk := _next_chunk(reader, report)) is not None:
+        yield _clean_chunk(chunk, report)
+
+
+def load_training_arrays(path, feature_cols, chunksize=50_000):
+    """
+    Returns (X, y, report): X is a float32 array of `feature_cols`, y the
+    lower-cased labels, and report counts what was read, kept and dropped.
+    """
+    report = LoadReport()
+    features, labels = [], []
+    for chunk in iter_clean_chunks(path, chunksize, report):
+        features.append(chunk[feature_cols].to_numpy(dtype=np.float32))
+        labels.append(chunk[LABEL_COL].to_numpy())
+
+    if not features:
+        return np.empty((0, len(feature_cols)), dtype=np.float32), np.empty(0, dtype=object), report
+    return np.concatenate(features), np.concatenate(labels), report
+
+
+def load_training_frame(path, feature_cols, chunksize=50_000):
+    """Like load_training_arrays, as a compact DataFrame with a label column."""
+    report = LoadReport()
+    columns = feature_cols + [LABEL_COL]
+    chunks = [chunk[columns] for chunk in iter_clean_chunks(path, chunksize, report)]
+    frame = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+    return frame, report
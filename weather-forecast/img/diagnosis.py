@@ -0,0 +1,260 @@
+"""
+Leaf-image diagnosis pipeline shared by the disease apps (cd.py, po.py).
+
+An upload goes through four stages, each reported to an optional
+`on_stage(stage, fraction_done)` callback so the apps can drive their
+progress bars from real work:
+
+    decode      bytes -> RGB image (JPEGs are decoded at reduced scale)
+    preprocess  resize and scale to the CNN's float32 input
+    infer       one forward pass of the disease CNN
+    lookup      predicted class -> disease knowledge base record
+
+diagnose_many() runs a whole field survey the same way, batch by batch.
+"""
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from knowledge import freeze
+
+DISEASE_MODEL_PATH = os.environ.get(
+    "DISEASE_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "disease_model.h5")
+)
+DISEASE_IMAGE_SIZE = int(os.environ.get("DISEASE_IMAGE_SIZE", "128"))
+DISEASE_BATCH_SIZE = int(os.environ.get("DISEASE_BATCH_SIZE", "16"))
+DECODE_WORKERS = int(os.environ.get("DISEASE_DECODE_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Output order of the CNN. Keras' image_dataset_from_directory numbers class
+# folders alphabetically, hence the default; override to match your model.
+DISEASE_CLASSES = [
+    name.strip() for name in os.environ.get(
+        "DISEASE_CLASSES", "Bacterial Leaf Spot,Early Blight,Healthy,Late Blight,Powdery Mildew"
+    ).split(",")
+]
+HEALTHY_CLASS = "Healthy"
+
+# Shown in place of a database entry when the leaf looks healthy.
+HEALTHY_INFO = freeze({
+    "scientific_name": "—",
+    "description": "No disease symptoms were detected on this leaf.",
+    "affected_crops": [],
+    "symptoms": [],
+    "severity": "None",
+    "severity_score": 0,
+    "solutions": {"chemical": [], "organic": [], "cultural": [], "biological": []},
+    "prevention": [
+        "Keep monitoring plants weekly for early signs",
+        "Maintain proper plant spacing and air circulation",
+    ],
+    "emoji": "✅",
+})
+
+# Share of the progress bar at the end of each stage.
+STAGES = (("decode", 0.25), ("preprocess", 0.4), ("infer", 0.9), ("lookup", 1.0))
+
+
+class ModelUnavailable(RuntimeError):
+    """Raised when the disease CNN file is missing or cannot be loaded."""
+
+
+def load_disease_model(path=DISEASE_MODEL_PATH):
+    if not os.path.exists(path):
+        raise ModelUnavailable(f"Disease model not found at {path} (set DISEASE_MODEL_PATH)")
+    try:
+        # Imported here so the apps start without paying for TensorFlow.
+        import tensorflow as tf
+        return tf.keras.models.load_model(path)
+    except Exception as e:
+        raise ModelUnavailable(f"Could not load the disease model: {e}") from e
+
+
+class DiseaseModelResource:
+    """
+    The disease CNN, loaded and warmed with a dummy forward pass once per
+    process on a background thread, then shared read-only by every session.
+    Created from st.cache_resource, so the first page render does not wait
+    for TensorFlow; check `ready` (or call wait()) before predicting.
+    """
+
+    def __init__(self, loader=load_disease_model, size=DISEASE_IMAGE_SIZE):
+        self._loader = loader
+        self._size = size
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.model = None
+        self.state = "idle"
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.start()
+
+    def start(self):
+        """Starts loading unless a load is running or done; retries after a failure."""
+        with self._lock:
+            if self.state in ("warming", "ready"):
+                return
+            self.state = "warming"
+            self.error = None
+            self._done.clear()
+        threading.Thread(target=self._load, name="disease-model-warmup", daemon=True).start()
+
+    def _load(self):
+        try:
+            start = time.perf_counter()
+            model = self._loader()
+            load_seconds = time.perf_counter() - start
+
+            # The first predict builds the graph; pay for it here, not in a user's analysis.
+            start = time.perf_counter()
+            model.predict(np.zeros((1, self._size, self._size, 3), dtype=np.float32), verbose=0)
+            self.warmup_seconds = time.perf_counter() - start
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+        else:
+            self.model = model
+            self.load_seconds = load_seconds
+            self.state = "ready"
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def wait(self, timeout=None):
+        """
+        Returns the model once it is warm, or None if `timeout` passes first.
+        Raises ModelUnavailable if loading failed.
+        """
+        if self.state == "failed":
+            self.start()  # e.g. the model file has been added since
+        self._done.wait(timeout)
+        if self.state == "failed":
+            raise ModelUnavailable(self.error)
+        return self.model if self.ready else None
+
+
+def decode(data, size=DISEASE_IMAGE_SIZE):
+    image = Image.open(io.BytesIO(data))
+    # Lets libjpeg scale by 1/2..1/8 while decoding; a no-op for PNG.
+    image.draft("RGB", (size, size))
+    return image.convert("RGB")
+
+
+def preprocess(image, size=DISEASE_IMAGE_SIZE):
+    image = image.resize((size, size), Image.BILINEAR, reducing_gap=2.0)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def lookup(probabilities, database):
+    """(disease name, database entry, confidence in percent) for one prediction."""
+    index = int(np.argmax(probabilities))
+    disease_name = DISEASE_CLASSES[index]
+    disease_info = HEALTHY_INFO if disease_name == HEALTHY_CLASS else database[disease_name]
+    return disease_name, disease_info, round(float(probabilities[index]) * 100, 1)
+
+
+def restrict_to_crop(probabilities, database, crop):
+    """
+    Zeroes the diseases the knowledge base does not list for `crop` (Healthy
+    always stays) and renormalizes. A crop with no listed diseases leaves
+    the prediction unchanged.
+    """
+    allowed = database.for_crop(crop)
+    if not allowed:
+        return probabilities
+    restricted = np.where(np.isin(DISEASE_CLASSES, (*allowed, HEALTHY_CLASS)), probabilities, 0)
+    total = restricted.sum()
+    return restricted / total if total > 0 else probabilities
+
+
+def diagnose(data, model, database, on_stage=None, crop=None):
+    """
+    Runs one uploaded image (bytes) through the pipeline. `database` is a
+    knowledge.KnowledgeBase; with `crop`, only that crop's diseases (and
+    Healthy) can be predicted. Returns a dict with disease_name,
+    disease_info, confidence (percent), probabilities (class -> probability)
+    and timings (stage -> ms).
+    """
+    timings = {}
+    fractions = dict(STAGES)
+
+    def stage(name, start):
+        timings[name] = (time.perf_counter() - start) * 1000
+        if on_stage is not None:
+            on_stage(name, fractions[name])
+
+    start = time.perf_counter()
+    image = decode(data)
+    stage("decode", start)
+
+    start = time.perf_counter()
+    batch = preprocess(image)[None]
+    stage("preprocess", start)
+
+    start = time.perf_counter()
+    probabilities = np.asarray(model.predict(batch, verbose=0))[0]
+    stage("infer", start)
+
+    start = time.perf_counter()
+    if crop is not None:
+        probabilities = restrict_to_crop(probabilities, database, crop)
+    disease_name, disease_info, confidence = lookup(probabilities, database)
+    stage("lookup", start)
+
+    return {
+        "disease_name": disease_name,
+        "disease_info": disease_info,
+        "confidence": confidence,
+        "probabilities": dict(zip(DISEASE_CLASSES, probabilities.astype(float).tolist())),
+        "timings": timings,
+    }
+
+
+def _load_input(upload):
+    # Runs on the decode pool; PIL releases the GIL while decoding and resizing.
+    try:
+        return preprocess(decode(upload.getvalue()))
+    except Exception:
+        return None
+
+
+def diagnose_many(uploads, model, database, batch_size=DISEASE_BATCH_SIZE, workers=DECODE_WORKERS):
+    """
+    Diagnoses a list of uploads (anything with .name and .getvalue(), like
+    Streamlit's UploadedFile) and yields one list of result rows per batch,
+    as soon as that batch is done. Images are decoded on a thread pool; the
+    next batch decodes while the current one is on the CNN, so at most two
+    batches of pixels are in memory whatever the number of uploads.
+
+    Each row has image, disease, confidence (percent), severity and
+    severity_score; an unreadable file gets disease None.
+    """
+    batches = [uploads[i:i + batch_size] for i in range(0, len(uploads), batch_size)]
+    with ThreadPoolExecutor(workers, thread_name_prefix="leaf-decode") as pool:
+        pending = [pool.submit(_load_input, upload) for upload in batches[0]] if batches else []
+        for number, batch in enumerate(batches):
+            inputs = [future.result() for future in pending]
+            pending = [pool.submit(_load_input, upload) for upload in batches[number + 1]] if number + 1 < len(batches) else []
+
+            images = [item for item in inputs if item is not None]
+            if images:
+                predictions = iter(np.asarray(model.predict(np.stack(images), verbose=0)))
+
+            rows = []
+            for upload, item in zip(batch, inputs):
+                if item is None:
+                    rows.append({"image": upload.name, "disease": None, "confidence": None,
+                                 "severity": "Unreadable image", "severity_score": None})
+                    continue
+                disease_name, disease_info, confidence = lookup(next(predictions), database)
+                rows.append({"image": upload.name, "disease": disease_name, "confidence": confidence,
+                             "severity": disease_info["severity"], "severity_score": disease_info["severity_score"]})
+            yield rows
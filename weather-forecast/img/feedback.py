@@ -0,0 +1,216 @@
+"""
+Field-outcome feedback for the crop recommender.
+
+FeedbackStore is an append-only log of (inputs, actual crop) records.
+LiveModel serves the compiled forest and folds new records into it in a
+background thread: small batches add trees to a copy of the forest with
+warm_start, and once enough feedback has piled up (or a crop the model has
+never seen arrives) the forest is rebuilt from scratch. Either way the new
+model replaces the old one in a single reference assignment.
+"""
+import copy
+import difflib
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+from forest import compile_forest
+from recommender import FEATURE_COLS, FEATURE_RANGES, load_or_train
+
+FEEDBACK_PATH = os.environ.get(
+    "RECOM_FEEDBACK_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "feedback.jsonl")
+)
+WARM_START_TREES = int(os.environ.get("RECOM_WARM_START_TREES", "25"))
+REBUILD_AFTER = int(os.environ.get("RECOM_REBUILD_AFTER", "200"))  # feedback rows since the last rebuild
+MAX_TREES = int(os.environ.get("RECOM_MAX_TREES", "400"))
+
+# Lower-cased crop names as typed into the "Other…" field.
+CROP_NAME = re.compile(r"[a-z][a-z -]{0,39}")
+
+
+def normalize_crop(name, known=()):
+    """
+    The label to record for a reported crop: lower case, single spaces. A
+    name matching one of the `known` classes up to spacing, punctuation,
+    a plural or a small typo ("Chick pea", "Tomatoes", "maiz") becomes that
+    class, so it is not taken for a new crop that forces a full rebuild.
+    Raises ValueError for an empty or implausible name.
+    """
+    crop = " ".join(str(name).lower().split())
+    if not crop:
+        raise ValueError("crop outcome is empty")
+    if not CROP_NAME.fullmatch(crop):
+        raise ValueError(f"{name!r} is not a crop name (letters, spaces and hyphens, at most 40 characters)")
+    by_key = {re.sub(r"[^a-z]", "", str(label)): str(label) for label in known}
+    key = re.sub(r"[^a-z]", "", crop)
+    if key in by_key:
+        return by_key[key]
+    close = difflib.get_close_matches(key, by_key, n=1, cutoff=0.85)
+    return by_key[close[0]] if close else crop
+
+
+class FeedbackStore:
+    """
+    One JSON object per line. Records are only ever appended; readers keep
+    the byte offset they have consumed up to and read what came after it.
+    """
+
+    def __init__(self, path=FEEDBACK_PATH):
+        self.path = path
+
+    def append(self, inputs, crop, source="ui", known_crops=()):
+        """Validates and records one outcome; `crop` goes through normalize_crop()."""
+        crop = normalize_crop(crop, known_crops)
+        record = {}
+        for name in FEATURE_COLS:
+            value = float(inputs[name])
+            low, high = FEATURE_RANGES[name]
+            if not low <= value <= high:
+                raise ValueError(f"{name}={value} outside [{low}, {high}]")
+            record[name] = value
+        record.update(label=crop, source=source, at=time.time())
+
+        line = (json.dumps(record) + "\n").encode()
+        # A single write() on an O_APPEND descriptor: lines from concurrent
+        # sessions or processes never interleave.
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return record
+
+    def read(self, offset=0):
+        """
+        Returns (records after `offset` as a DataFrame, new offset). A line
+        still being written is left for the next read.
+        """
+        columns = FEATURE_COLS + ['label']
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=columns), offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # a torn or hand-edited line; skip it rather than stop reading
+        frame = pd.DataFrame(records, columns=columns).dropna()
+        return frame, offset + end
+
+
+class LiveModel:
+    """
+    Holds the model recom.py predicts with. `current` is a (compiled forest,
+    info) pair: read it once per rerun and that session keeps a consistent
+    model while the next one is built.
+    """
+
+    def __init__(self, base_df, store=None, warm_start_trees=WARM_START_TREES, rebuild_after=REBUILD_AFTER,
+                 max_trees=MAX_TREES):
+        self.base_df = base_df
+        self.store = store or FeedbackStore()
+        self.warm_start_trees = warm_start_trees
+        self.rebuild_after = rebuild_after
+        self.max_trees = max_trees
+        self.version = 0
+        self.error = None
+
+        self._update_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._pending = False
+        self._worker = None
+
+        # Start from everything recorded so far. The rebuild goes through
+        # load_or_train, so a restart with unchanged feedback loads from disk.
+        self.feedback, self._offset = self.store.read()
+        self._since_rebuild = 0
+        self._rebuild()
+
+    def _training_df(self):
+        if not len(self.feedback):
+            return self.base_df
+        return pd.concat([self.base_df[FEATURE_COLS + ['label']], self.feedback], ignore_index=True)
+
+    def _publish(self, fitted, info):
+        self._fitted = fitted
+        self.version += 1
+        info = {
+            **info,
+            "version": self.version,
+            "trees": len(fitted.estimators_),
+            "feedback_rows": len(self.feedback),
+        }
+        # A single reference assignment: each rerun sees the old model or the new one, never a mix.
+        self.current = (compile_forest(fitted), info)
+
+    def _rebuild(self):
+        fitted, info = load_or_train(self._training_df())
+        self._since_rebuild = 0
+        self._publish(fitted, {**info, "update": "rebuild"})
+
+    def _warm_start(self, df):
+        start = time.perf_counter()
+        # Grow a copy; the served forest is never touched.
+        fitted = copy.deepcopy(self._fitted)
+        fitted.set_params(warm_start=True, n_estimators=len(fitted.estimators_) + self.warm_start_trees)
+        fitted.fit(df[FEATURE_COLS], df['label'])
+        fitted.set_params(warm_start=False)
+        self._publish(fitted, {"source": "warm-started", "seconds": time.perf_counter() - start, "update": "warm start"})
+
+    def update(self):
+        """
+        Folds any new feedback into the model. Returns the update kind, or
+        None when there was nothing new.
+        """
+        with self._update_lock:
+            new, offset = self.store.read(self._offset)
+            self._offset = offset
+            if not len(new):
+                return None
+            self.feedback = pd.concat([self.feedback, new], ignore_index=True)
+            self._since_rebuild += len(new)
+
+            unseen = set(new['label']) - set(self._fitted.classes_)
+            too_big = len(self._fitted.estimators_) + self.warm_start_trees > self.max_trees
+            if unseen or too_big or self._since_rebuild >= self.rebuild_after:
+                self._rebuild()
+            else:
+                # New trees see the full history with the new outcomes, so
+                # the class set (and the tree encoding) stays the same.
+                self._warm_start(self._training_df())
+            self.error = None
+            return self.current[1]["update"]
+
+    def request_update(self):
+        """Schedules update() on a background thread and returns at once."""
+        with self._state_lock:
+            self._pending = True
+            if self._worker is not None:
+                return  # the running worker will pick the request up
+            self._worker = threading.Thread(target=self._update_loop, name="crop-model-update", daemon=True)
+            self._worker.start()
+
+    def _update_loop(self):
+        while True:
+            with self._state_lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                self._pending = False
+            try:
+                self.update()
+            except Exception as e:
+                self.error = str(e)  # keep serving the previous version
+
+    @property
+    def updating(self):
+        return self._worker is not None
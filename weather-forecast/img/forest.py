@@ -0,0 +1,238 @@
+"""
+A fitted RandomForestClassifier flattened into a few contiguous NumPy
+arrays, and a predictor that walks every tree at once on them.
+
+scikit-learn's predict_proba validates the input and dispatches each tree
+from Python, which for one 6-feature row costs far more than the
+comparisons themselves. CompiledForest does the same arithmetic in the
+same order (float32 features against the thresholds, per-tree leaf
+fractions summed tree by tree, then divided by the tree count), so its
+probabilities are bit-identical to the model's.
+
+The walk wins by a wide margin on a row or a small batch. On large
+batches scikit-learn's compiled tree loop is faster, so a forest built by
+compile_forest() hands batches of more than MODEL_ROWS rows to the fitted
+model it came from. One loaded from .npz has no model and always walks.
+"""
+import copy
+
+import numpy as np
+import sklearn
+
+# scikit-learn >= 1.4 stores class fractions in tree_.value; older versions
+# store counts and normalise them in predict_proba.
+_VALUE_IS_FRACTION = tuple(int(part) for part in sklearn.__version__.split(".")[:2]) >= (1, 4)
+
+# Rows walked per chunk: (trees x rows) node indices stay cache-sized.
+CHUNK_NODES = 1 << 16
+
+# Below this many rows the per-tree leaf fractions are gathered and summed in
+# one call; above it a loop over trees avoids the (trees x rows x classes) block.
+GATHER_ROWS = 16
+
+# Batches larger than this go to the fitted model when there is one: below it
+# the walk wins, above it scikit-learn does (measured with bench.py predict).
+MODEL_ROWS = 2048
+
+
+class CompiledForest:
+    """
+    All trees share one node table. Leaves point to themselves, so walking
+    `depth` steps from the roots lands every row on its leaf in every tree.
+    `model` is the fitted forest the arrays came from, if any; it is not saved.
+    """
+
+    def __init__(self, classes, feature, threshold, children, missing_left, leaf_proba, roots, depth,
+                 feature_names=None, model=None):
+        self.classes_ = classes
+        self.feature = feature
+        self.threshold = threshold
+        # children[2 * node] is the left child, children[2 * node + 1] the right.
+        self.children = children
+        self.missing_left = missing_left
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.depth = int(depth)
+        self.feature_names = feature_names
+        self.model = model
+        self.n_features = int(feature.max()) + 1 if len(feature) else 0
+        # Walk "slots" (2 * node) so the chosen child is slot + go_right with
+        # no multiply per step; per-node arrays are repeated to match.
+        self._slot_feature = np.repeat(feature, 2)
+        self._slot_threshold = np.repeat(_float32_floor(threshold), 2)
+        self._slot_missing_right = np.repeat(~missing_left, 2)
+        self._slot_children = 2 * children
+        self._root_slots = 2 * roots
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self._ARRAYS)
+
+    _ARRAYS = ("classes_", "feature", "threshold", "children", "missing_left", "leaf_proba", "roots")
+
+    def _as_array(self, X):
+        if hasattr(X, "columns") and self.feature_names is not None:
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] < self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, the forest uses {self.n_features}")
+        return X
+
+    def _leaves(self, X):
+        """(n_trees, n_rows) leaf index of every row in every tree."""
+        n_rows = len(X)
+        # Feature-major, so one flat gather fetches each row's split value.
+        columns = np.ascontiguousarray(X.T).ravel()
+        has_nan = np.isnan(columns).any()
+        offsets = (self._slot_feature * n_rows).astype(self._slot_children.dtype)
+        rows = np.arange(n_rows, dtype=offsets.dtype)[None, :]
+        slots = np.repeat(self._root_slots[:, None], n_rows, axis=1)
+        # One set of buffers for every level; the walk allocates nothing per step.
+        index = np.empty_like(slots)
+        values = np.empty(slots.shape, dtype=np.float32)
+        thresholds = np.empty(slots.shape, dtype=np.float32)
+        go_right = np.empty(slots.shape, dtype=bool)
+        for _ in range(self.depth):
+            np.take(offsets, slots, out=index)
+            index += rows
+            np.take(columns, index, out=values)
+            np.take(self._slot_threshold, slots, out=thresholds)
+            # NaN compares False here; sklearn sends it the node's missing-value way.
+            np.greater(values, thresholds, out=go_right)
+            if has_nan:
+                go_right = np.where(np.isnan(values), np.take(self._slot_missing_right, slots), go_right)
+            slots += go_right
+            np.take(self._slot_children, slots, out=slots)
+        return slots // 2
+
+    def predict_proba(self, X):
+        X = self._as_array(X)
+        if self.model is not None and len(X) > MODEL_ROWS:
+            return self.model.predict_proba(X)
+        out = np.zeros((len(X), self.leaf_proba.shape[1]), dtype=np.float64)
+        chunk = max(1, CHUNK_NODES // self.n_trees)
+        for start in range(0, len(X), chunk):
+            leaves = self._leaves(X[start:start + chunk])
+            part = out[start:start + chunk]
+            # Summed tree by tree in tree order, like the forest's accumulation
+            # loop, so the float64 result matches to the bit.
+            if len(part) <= GATHER_ROWS:
+                np.add.reduce(self.leaf_proba[leaves], axis=0, out=part)
+            else:
+                for tree_leaves in leaves:
+                    part += self.leaf_proba[tree_leaves]
+        out /= self.n_trees
+        return out
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def save(self, path):
+        """Plain .npz: loads without unpickling or importing scikit-learn."""
+        np.savez(
+            path,
+            depth=self.depth,
+            feature_names=np.array(self.feature_names or [], dtype=str),
+            **{name: getattr(self, name) for name in self._ARRAYS if name != "classes_"},
+            classes_=self.classes_.astype(str),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in cls._ARRAYS if name != "classes_"}
+            classes = data["classes_"].astype(object)
+            feature_names = [str(name) for name in data["feature_names"]] or None
+            return cls(classes, **arrays, depth=data["depth"], feature_names=feature_names)
+
+
+def _float32_floor(threshold):
+    """
+    The largest float32 at or below each float64 threshold. For a float32 x,
+    x > t exactly when x > floor32(t), so the walk compares in float32 and
+    still sends every row where sklearn's float64 comparison does.
+    """
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def compile_forest(model, classes=None):
+    """
+    Flattens a fitted RandomForestClassifier (single output) or a single
+    decision tree into a CompiledForest.
+
+    With `classes`, `model` is instead a multi-output regression forest or
+    tree fitted to class probabilities (a distilled student); its averaged
+    outputs are served as the probabilities of those classes.
+    """
+    estimators = getattr(model, "estimators_", [model])
+    student = classes is not None
+    if classes is None:
+        if model.n_outputs_ != 1:
+            raise ValueError("only single-output forests can be compiled")
+        classes = model.classes_
+    elif model.n_outputs_ != len(classes):
+        raise ValueError(f"model has {model.n_outputs_} outputs for {len(classes)} classes")
+    regression = not hasattr(model, "classes_")
+    n_classes = len(classes)
+    feature, threshold, children, missing_left, leaf_proba, roots = [], [], [], [], [], []
+    depth = 0
+    offset = 0
+
+    for estimator in estimators:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        own = np.arange(tree.node_count) + offset
+
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+        left = np.where(is_leaf, own, tree.children_left + offset)
+        right = np.where(is_leaf, own, tree.children_right + offset)
+        children.append(np.stack([left, right], axis=1).ravel())
+        if hasattr(tree, "missing_go_to_left"):
+            missing_left.append(tree.missing_go_to_left.astype(bool))
+        else:
+            missing_left.append(np.zeros(tree.node_count, dtype=bool))
+
+        if regression:
+            proba = tree.value[:, :, 0].astype(np.float64)
+        else:
+            proba = tree.value[:, 0, :n_classes].astype(np.float64)
+        if not regression and not _VALUE_IS_FRACTION:
+            normalizer = proba.sum(axis=1)[:, None]
+            normalizer[normalizer == 0.0] = 1.0
+            proba = proba / normalizer
+        leaf_proba.append(proba)
+
+        roots.append(offset)
+        depth = max(depth, tree.max_depth)
+        offset += tree.node_count
+
+    index = np.int32 if offset < 2 ** 31 else np.int64
+    feature_names = getattr(model, "feature_names_in_", None)
+    if not student and feature_names is not None:
+        # predict_proba() passes the model the same column-ordered array as the
+        # walk; without the names it takes that array without a warning.
+        model = copy.copy(model)
+        del model.feature_names_in_
+    return CompiledForest(
+        classes=np.asarray(classes),
+        feature=np.concatenate(feature).astype(np.int32),
+        threshold=np.concatenate(threshold).astype(np.float64),
+        children=np.concatenate(children).astype(index),
+        missing_left=np.concatenate(missing_left),
+        leaf_proba=np.ascontiguousarray(np.concatenate(leaf_proba)),
+        roots=np.array(roots, dtype=index),
+        depth=depth,
+        feature_names=None if feature_names is None else [str(name) for name in feature_names],
+        # A distilled student has no predict_proba to hand batches to.
+        model=None if student else model,
+    )
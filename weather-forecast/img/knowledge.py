@@ -0,0 +1,189 @@
+"""
+Disease knowledge base shared by the disease apps (cd.py, po.py).
+
+Entries live in diseases.json and are loaded once per process into
+read-only records: a record reads like the old dict literal
+(record['solutions']['chemical']) but its mappings cannot be changed and
+its lists are tuples. Indexes are built at load time:
+
+    by_crop       affected crop -> disease names
+    by_severity   disease names, most severe first
+    by_treatment  treatment category -> names of diseases with at least one option in it
+    search()      BM25-ranked diseases for a free-text symptom description
+
+`python bench.py diseases` measures load, lookup and search cost as the file grows.
+"""
+import json
+import os
+import re
+from collections import Counter
+from collections.abc import Mapping
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+
+DISEASE_DB_PATH = os.environ.get(
+    "DISEASE_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "diseases.json")
+)
+SCHEMA_VERSION = 1  # bump when the record layout changes; "version" in the file tracks its content
+TREATMENT_CATEGORIES = ("chemical", "organic", "cultural", "biological")
+REQUIRED_FIELDS = (
+    "name", "scientific_name", "description", "affected_crops", "symptoms", "severity", "severity_score",
+    "solutions", "prevention", "emoji",
+)
+
+
+# Words that say nothing about a disease; dropped from documents and queries alike.
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or the to with without my our their "
+    "this that these those very some there".split()
+)
+
+
+@lru_cache(maxsize=65536)
+def _term(word):
+    # Folds plurals: leaves -> leaf, spots -> spot. Cached, since a vocabulary repeats endlessly.
+    if word in STOPWORDS:
+        return None
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("ves"):
+        return word[:-3] + "f"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercase word tokens, stopwords removed and plurals folded."""
+    terms = map(_term, re.findall(r"[a-z0-9]+", text.lower()))
+    return [term for term in terms if term is not None]
+
+
+class SymptomIndex:
+    """
+    Inverted index with Okapi BM25 ranking. Each term's postings hold the
+    matching document numbers and their precomputed BM25 weights, so a
+    query only adds a few arrays into a score vector.
+    """
+
+    def __init__(self, documents, k1=1.2, b=0.75):
+        """`documents` is a list of (name, text) pairs."""
+        self.names = [name for name, _ in documents]
+        vocabulary, term_ids, doc_ids, tfs, lengths = {}, [], [], [], []
+        for doc, (_, text) in enumerate(documents):
+            count = Counter(tokenize(text))
+            term_ids.extend(vocabulary.setdefault(term, len(vocabulary)) for term in count)
+            doc_ids.extend([doc] * len(count))
+            tfs.extend(count.values())
+            lengths.append(sum(count.values()))
+        term_ids = np.array(term_ids, dtype=np.int32)
+        doc_ids = np.array(doc_ids, dtype=np.int32)
+        tfs = np.array(tfs, dtype=np.float32)
+        lengths = np.array(lengths, dtype=np.float32)
+
+        # Every (term, document) weight at once, then grouped into per-term postings.
+        df = np.bincount(term_ids, minlength=len(vocabulary))
+        idf = np.log1p((len(documents) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths[doc_ids] / max(float(lengths.mean()) if len(lengths) else 0.0, 1e-9))
+        weights = idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)
+        order = np.argsort(term_ids, kind="stable")
+        bounds = np.cumsum(df)[:-1]
+        self._postings = dict(zip(vocabulary, zip(
+            np.split(doc_ids[order], bounds), np.split(weights[order].astype(np.float32), bounds)
+        )))
+
+    def search(self, query, limit=5):
+        """[(name, score), ...] best first; documents sharing no term with the query are left out."""
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self._postings]
+        if not terms:
+            return []
+        scores = np.zeros(len(self.names), dtype=np.float32)
+        for term in terms:
+            docs, weights = self._postings[term]
+            scores[docs] += weights
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.names[doc], float(scores[doc])) for doc in matched]
+
+
+def freeze(value):
+    """Read-only copy of parsed JSON: dicts become mapping proxies, lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class KnowledgeBase(Mapping):
+    """
+    Disease name -> record, in file order, with the indexes above. Being a
+    Mapping it can stand in wherever the apps used DISEASE_DATABASE.
+    """
+
+    def __init__(self, entries, version=None):
+        self.version = version
+        records = {}
+        by_crop = {}
+        by_treatment = {category: [] for category in TREATMENT_CATEGORIES}
+        for entry in entries:
+            missing = [field for field in REQUIRED_FIELDS if field not in entry]
+            if missing:
+                raise ValueError(f"disease entry {entry.get('name', '?')!r} is missing {', '.join(missing)}")
+            name = entry["name"]
+            if name in records:
+                raise ValueError(f"disease {name!r} appears twice")
+            record = freeze({key: value for key, value in entry.items() if key != "name"})
+            records[name] = record
+
+            for crop in record["affected_crops"]:
+                by_crop.setdefault(crop, []).append(name)
+            for category in TREATMENT_CATEGORIES:
+                if record["solutions"].get(category):
+                    by_treatment[category].append(name)
+
+        self._records = records
+        self.by_crop = MappingProxyType({crop: tuple(names) for crop, names in sorted(by_crop.items())})
+        self.by_severity = tuple(sorted(records, key=lambda name: -records[name]["severity_score"]))
+        self.by_treatment = MappingProxyType({category: tuple(names) for category, names in by_treatment.items()})
+        self.symptom_index = SymptomIndex([
+            (name, " ".join([name, record["scientific_name"], record["description"], *record["symptoms"]]))
+            for name, record in records.items()
+        ])
+
+    def __getitem__(self, name):
+        return self._records[name]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    @property
+    def crops(self):
+        return tuple(self.by_crop)
+
+    def for_crop(self, crop):
+        """Names of the diseases affecting `crop`, empty for an unknown crop."""
+        return self.by_crop.get(crop, ())
+
+    def search(self, query, limit=5):
+        """Diseases whose symptoms, description or scientific name match `query`, as (name, score), best first."""
+        return self.symptom_index.search(query, limit)
+
+    @property
+    def mean_severity(self):
+        return sum(record["severity_score"] for record in self._records.values()) / max(len(self), 1)
+
+
+def load_knowledge_base(path=DISEASE_DB_PATH):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("schema_version") != SCHEMA_VERSION:
+        raise ValueError(f"{path} has schema version {data.get('schema_version')}, expected {SCHEMA_VERSION}")
+    return KnowledgeBase(data["diseases"], data.get("version"))
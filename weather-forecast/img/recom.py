@@ -1,12 +1,16 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
 import plotly.express as px
 from PIL import Image
 import requests
 import time
 
+from feedback import LiveModel
+from recommender import FEATURE_RANGES, base_dataset, what_if_grid
+
+rerun_start = time.perf_counter()
+
 # Page config
 st.set_page_config(page_title="🌱 Smart Crop Recommendation System", layout="wide", page_icon="🌾")
 
@@ -165,105 +169,17 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Create simplified dataset with only required parameters
-np.random.seed(42)
-n_samples = 300
-
-data = {
-    'N': np.random.uniform(0, 200, n_samples).round(1),
-    'P': np.random.uniform(0, 150, n_samples).round(1),
-    'K': np.random.uniform(0, 250, n_samples).round(1),
-    'rainfall': np.random.uniform(100, 400, n_samples).round(1),
-    'humidity': np.random.uniform(20, 95, n_samples).round(1),
-    'temperature': np.random.uniform(10, 40, n_samples).round(1),  # Added temperature
-}
-
-df = pd.DataFrame(data)
+# Train (or load) the model once per server process and share it across
+# sessions, instead of refitting on every widget interaction. Predictions
+# run on the compiled arrays, which give the forest's exact probabilities
+# without scikit-learn's per-call overhead. Field feedback is folded in on
+# a background thread; each rerun reads whichever version is current.
+@st.cache_resource(show_spinner="🌱 Preparing crop model...")
+def get_live_model():
+    return LiveModel(base_dataset())
 
-# Assign crops based on simplified conditions
-def assign_crop_simple(row):
-    n, p, k = row['N'], row['P'], row['K']
-    rainfall = row['rainfall']
-    humidity = row['humidity']
-    temperature = row['temperature']  # Added temperature
-    
-    # Rice - needs high rainfall, humidity, and warm temperature
-    if rainfall > 300 and humidity > 80 and n > 100 and temperature > 20:
-        return 'rice'
-    
-    # Wheat - moderate conditions, cooler temperature
-    elif 200 < rainfall < 300 and 50 < humidity < 80 and p > 40 and 15 < temperature < 25:
-        return 'wheat'
-    
-    # Maize - good rainfall, potassium, and warm temperature
-    elif rainfall > 250 and humidity > 60 and k > 100 and temperature > 18:
-        return 'maize'
-    
-    # Cotton - lower humidity needs, warm temperature
-    elif rainfall < 250 and humidity < 60 and n > 80 and temperature > 22:
-        return 'cotton'
-    
-    # Sugarcane - high rainfall, warm temperature
-    elif rainfall > 350 and humidity > 75 and temperature > 20:
-        return 'sugarcane'
-    
-    # Fruits based on conditions - warm temperatures
-    elif humidity > 70 and rainfall > 200 and temperature > 18:
-        return np.random.choice(['banana', 'papaya', 'pineapple', 'mango', 'coconut'])
-    
-    # Vegetables - moderate conditions, moderate temperature
-    elif 150 < rainfall < 300 and 50 < humidity < 80 and 15 < temperature < 30:
-        return np.random.choice(['tomato', 'potato', 'cucumber', 'onion'])
-    
-    # Legumes - lower nitrogen needs, moderate temperature
-    elif n < 80 and p > 30 and 15 < temperature < 30:
-        return np.random.choice(['mungbean', 'chickpea', 'kidneybeans', 'lentil'])
-    
-    # Coffee - specific humidity, rainfall, and temperature
-    elif 150 < rainfall < 300 and 70 < humidity < 90 and 18 < temperature < 25:
-        return 'coffee'
-    
-    # Jute - high rainfall, warm temperature
-    elif rainfall > 300 and temperature > 22:
-        return 'jute'
-    
-    # Watermelon - hot and humid
-    elif humidity > 70 and rainfall > 200 and temperature > 25:
-        return 'watermelon'
-    
-    else:
-        # Default based on primary nutrients and temperature
-        if temperature > 25:
-            if n > p and n > k:
-                return 'cotton'
-            elif p > n and p > k:
-                return 'potato'
-            else:
-                return 'banana'
-        else:
-            if n > p and n > k:
-                return 'wheat'
-            elif p > n and p > k:
-                return 'potato'
-            else:
-                return 'mungbean'
-
-df['label'] = df.apply(assign_crop_simple, axis=1)
-
-# Train model with only required features
-feature_cols = ['N', 'P', 'K', 'rainfall', 'humidity', 'temperature']  # Added temperature
-
-X = df[feature_cols]
-y = df['label']
-
-model = RandomForestClassifier(
-    n_estimators=200, 
-    random_state=42, 
-    max_depth=10,
-    min_samples_split=5,
-    min_samples_leaf=2
-)
-model.fit(X, y)
+live_model = get_live_model()
+model, model_info = live_model.current
 
 # Header
 st.markdown("""
@@ -300,6 +216,8 @@ with col2:
 
 st.markdown('</div>', unsafe_allow_html=True)
 
+point = {'N': N, 'P': P, 'K': K, 'rainfall': rainfall, 'humidity': humidity, 'temperature': temperature}
+
 # Center the button
 col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
 with col_btn2:
@@ -312,8 +230,8 @@ if analyze_clicked:
     ]])
     
     # Get predictions
-    prediction = model.predict(input_data)[0]
     probabilities = model.predict_proba(input_data)[0]
+    prediction = model.classes_[np.argmax(probabilities)]
     
     # Top recommendations
     prob_df = pd.DataFrame({
@@ -337,6 +255,76 @@ if analyze_clicked:
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+# What-if sensitivity: sweep one or two inputs around the current sliders
+# and score the whole grid in a single predict_proba call.
+FEATURE_LABELS = {
+    'N': 'Nitrogen (kg/ha)', 'P': 'Phosphorus (kg/ha)', 'K': 'Potassium (kg/ha)',
+    'rainfall': 'Rainfall (mm)', 'humidity': 'Humidity (%)', 'temperature': 'Temperature (°C)',
+}
+
+if st.toggle("🔬 WHAT-IF SENSITIVITY", help="See how the recommendation changes as inputs move"):
+    col_a, col_b, col_c = st.columns([2, 1, 1])
+    with col_a:
+        varied = st.multiselect("Inputs to vary", list(FEATURE_RANGES), default=['rainfall', 'temperature'],
+                                max_selections=2, format_func=FEATURE_LABELS.get)
+    with col_b:
+        span = st.slider("Range around current value (%)", 5, 100, 25, 5) / 100
+    with col_c:
+        steps = st.select_slider("Grid resolution", [10, 25, 50, 100], value=50 if len(varied) == 2 else 100)
+
+    if varied:
+        grid, axes = what_if_grid(point, varied, span=span, steps=steps)
+        score_start = time.perf_counter()
+        grid_proba = model.predict_proba(grid)
+        score_ms = (time.perf_counter() - score_start) * 1000
+
+        # Crops that matter somewhere on the grid, best first.
+        peak = grid_proba.max(axis=0)
+        top = np.argsort(peak)[::-1][:4 if len(varied) == 2 else 8]
+        top = top[peak[top] > 0]
+
+        if len(varied) == 1:
+            name = varied[0]
+            fig = px.imshow(
+                grid_proba[:, top].T, x=axes[name], y=[model.classes_[i].title() for i in top],
+                labels={'x': FEATURE_LABELS[name], 'color': 'Probability'},
+                color_continuous_scale='Greens', zmin=0, zmax=1, aspect='auto',
+            )
+            fig.add_vline(x=point[name], line_dash='dash', line_color='#1B5E20')
+        else:
+            first, second = varied
+            cube = grid_proba.reshape(steps, steps, -1)[:, :, top].transpose(2, 1, 0)
+            fig = px.imshow(
+                cube, x=axes[first], y=axes[second], facet_col=0, facet_col_wrap=2, origin='lower',
+                labels={'x': FEATURE_LABELS[first], 'y': FEATURE_LABELS[second], 'color': 'Probability'},
+                color_continuous_scale='Greens', zmin=0, zmax=1, aspect='auto',
+            )
+            for annotation in fig.layout.annotations:
+                annotation.text = model.classes_[top[int(annotation.text.split('=')[1])]].title()
+            fig.add_scatter(x=[point[first]], y=[point[second]], mode='markers', showlegend=False,
+                            marker=dict(symbol='x', size=12, color='#FFB300'), row='all', col='all')
+        fig.update_layout(height=350 if len(varied) == 1 else 650, margin=dict(t=40, b=20))
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"Scored {len(grid):,} input combinations in {score_ms:.0f} ms · × marks your current inputs")
+
+# Field outcomes feed back into the model without blocking this session.
+with st.expander("📝 REPORT A FIELD OUTCOME"):
+    st.write("Record what actually grew best under the conditions set above.")
+    OTHER_CROP = "Other…"
+    choice = st.selectbox("Crop outcome", [crop.title() for crop in sorted(model.classes_)] + [OTHER_CROP])
+    outcome = st.text_input("Crop name") if choice == OTHER_CROP else choice
+    if st.button("💾 SAVE OUTCOME"):
+        try:
+            record = live_model.store.append(point, outcome, known_crops=model.classes_)
+        except ValueError as e:
+            st.error(f"Not saved: {e}")
+        else:
+            live_model.request_update()
+            st.success(f"Saved as {record['label'].title()}. The model is updating in the background "
+                       f"(now v{model_info['version']}).")
+    if live_model.error:
+        st.warning(f"Last model update failed, still serving v{model_info['version']}: {live_model.error}")
+
 # Footer
 st.markdown("""
 <div class="footer">
@@ -347,3 +335,11 @@ st.markdown("""
     </p>
 </div>
 """, unsafe_allow_html=True)
+
+st.caption(
+    f"⏱️ Rerun: {(time.perf_counter() - rerun_start) * 1000:.0f} ms · "
+    f"model {'loaded from disk' if model_info['source'] == 'disk' else model_info['source']} "
+    f"in {model_info['seconds'] * 1000:.0f} ms (once per server) · "
+    f"v{model_info['version']}, {model_info['trees']} trees, {model_info['feedback_rows']} feedback rows"
+    f"{' · updating…' if live_model.updating else ''}"
+)
@@ -0,0 +1,326 @@
+"""
+Training data and model for the crop recommender in recom.py.
+
+Training is kept out of the Streamlit script so it does not rerun on every
+widget interaction: recom.py wraps load_or_train() in st.cache_resource
+(one model per server process, shared by all sessions), and load_or_train()
+keeps the fitted forest on disk keyed by a hash of everything that
+determines it, so a restarted server loads instead of refitting.
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+
+from dataset import load_training_frame
+
+FEATURE_COLS = ['N', 'P', 'K', 'rainfall', 'humidity', 'temperature']
+
+MODEL_PARAMS = {
+    'n_estimators': 200,
+    'random_state': 42,
+    'max_depth': 10,
+    'min_samples_split': 5,
+    'min_samples_leaf': 2,
+}
+
+# Slider bounds in recom.py, which are also the synthetic data's ranges.
+FEATURE_RANGES = {
+    'N': (0.0, 200.0),
+    'P': (0.0, 150.0),
+    'K': (0.0, 250.0),
+    'rainfall': (100.0, 400.0),
+    'humidity': (20.0, 95.0),
+    'temperature': (10.0, 40.0),
+}
+
+N_SAMPLES = 300
+SEED = 42
+
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache")
+# Forest artifacts kept in MODEL_CACHE_DIR; the least recently used go first.
+# Every feedback rebuild writes a new one, so without a bound they pile up.
+MODEL_CACHE_KEEP = int(os.environ.get("RECOM_MODEL_CACHE_KEEP", "4"))
+
+# Train on a real CSV (e.g. cd.csv) instead of the synthetic rows when set.
+TRAINING_CSV = os.environ.get("RECOM_TRAINING_CSV")
+
+
+# Assign crops based on simplified conditions
+def assign_crop_simple(row):
+    n, p, k = row['N'], row['P'], row['K']
+    rainfall = row['rainfall']
+    humidity = row['humidity']
+    temperature = row['temperature']
+
+    # Rice - needs high rainfall, humidity, and warm temperature
+    if rainfall > 300 and humidity > 80 and n > 100 and temperature > 20:
+        return 'rice'
+
+    # Wheat - moderate conditions, cooler temperature
+    elif 200 < rainfall < 300 and 50 < humidity < 80 and p > 40 and 15 < temperature < 25:
+        return 'wheat'
+
+    # Maize - good rainfall, potassium, and warm temperature
+    elif rainfall > 250 and humidity > 60 and k > 100 and temperature > 18:
+        return 'maize'
+
+    # Cotton - lower humidity needs, warm temperature
+    elif rainfall < 250 and humidity < 60 and n > 80 and temperature > 22:
+        return 'cotton'
+
+    # Sugarcane - high rainfall, warm temperature
+    elif rainfall > 350 and humidity > 75 and temperature > 20:
+        return 'sugarcane'
+
+    # Fruits based on conditions - warm temperatures
+    elif humidity > 70 and rainfall > 200 and temperature > 18:
+        return np.random.choice(['banana', 'papaya', 'pineapple', 'mango', 'coconut'])
+
+    # Vegetables - moderate conditions, moderate temperature
+    elif 150 < rainfall < 300 and 50 < humidity < 80 and 15 < temperature < 30:
+        return np.random.choice(['tomato', 'potato', 'cucumber', 'onion'])
+
+    # Legumes - lower nitrogen needs, moderate temperature
+    elif n < 80 and p > 30 and 15 < temperature < 30:
+        return np.random.choice(['mungbean', 'chickpea', 'kidneybeans', 'lentil'])
+
+    # Coffee - specific humidity, rainfall, and temperature
+    elif 150 < rainfall < 300 and 70 < humidity < 90 and 18 < temperature < 25:
+        return 'coffee'
+
+    # Jute - high rainfall, warm temperature
+    elif rainfall > 300 and temperature > 22:
+        return 'jute'
+
+    # Watermelon - hot and humid
+    elif humidity > 70 and rainfall > 200 and temperature > 25:
+        return 'watermelon'
+
+    else:
+        # Default based on primary nutrients and temperature
+        if temperature > 25:
+            if n > p and n > k:
+                return 'cotton'
+            elif p > n and p > k:
+                return 'potato'
+            else:
+                return 'banana'
+        else:
+            if n > p and n > k:
+                return 'wheat'
+            elif p > n and p > k:
+                return 'potato'
+            else:
+                return 'mungbean'
+
+
+FRUITS = ['banana', 'papaya', 'pineapple', 'mango', 'coconut']
+VEGETABLES = ['tomato', 'potato', 'cucumber', 'onion']
+LEGUMES = ['mungbean', 'chickpea', 'kidneybeans', 'lentil']
+
+
+def label_crops(df, random_state=None):
+    """
+    Vectorized assign_crop_simple: the same rule cascade as boolean masks
+    over whole columns.
+
+    The fruit/vegetable/legume picks are drawn in one randint call over the
+    rows that reach those branches, in row order. With numpy's legacy
+    RandomState (the global np.random by default) that consumes the stream
+    exactly like one np.random.choice per row, so the labels are identical
+    to df.apply(assign_crop_simple, axis=1) under the same seed.
+    """
+    rng = np.random if random_state is None else random_state
+    n = df['N'].to_numpy()
+    p = df['P'].to_numpy()
+    k = df['K'].to_numpy()
+    rainfall = df['rainfall'].to_numpy()
+    humidity = df['humidity'].to_numpy()
+    temperature = df['temperature'].to_numpy()
+
+    # (condition, outcome) in the order assign_crop_simple tests them; a list
+    # outcome means a random pick from that group.
+    rules = [
+        ((rainfall > 300) & (humidity > 80) & (n > 100) & (temperature > 20), 'rice'),
+        ((200 < rainfall) & (rainfall < 300) & (50 < humidity) & (humidity < 80) & (p > 40)
+         & (15 < temperature) & (temperature < 25), 'wheat'),
+        ((rainfall > 250) & (humidity > 60) & (k > 100) & (temperature > 18), 'maize'),
+        ((rainfall < 250) & (humidity < 60) & (n > 80) & (temperature > 22), 'cotton'),
+        ((rainfall > 350) & (humidity > 75) & (temperature > 20), 'sugarcane'),
+        ((humidity > 70) & (rainfall > 200) & (temperature > 18), FRUITS),
+        ((150 < rainfall) & (rainfall < 300) & (50 < humidity) & (humidity < 80)
+         & (15 < temperature) & (temperature < 30), VEGETABLES),
+        ((n < 80) & (p > 30) & (15 < temperature) & (temperature < 30), LEGUMES),
+        ((150 < rainfall) & (rainfall < 300) & (70 < humidity) & (humidity < 90)
+         & (18 < temperature) & (temperature < 25), 'coffee'),
+        ((rainfall > 300) & (temperature > 22), 'jute'),
+        ((humidity > 70) & (rainfall > 200) & (temperature > 25), 'watermelon'),
+    ]
+    conditions = [condition for condition, _ in rules]
+    outcomes = [outcome for _, outcome in rules]
+    branch = np.select(conditions, np.arange(len(conditions)), default=len(conditions))
+
+    # Default based on primary nutrients and temperature
+    n_top = (n > p) & (n > k)
+    p_top = (p > n) & (p > k)
+    labels = np.where(
+        temperature > 25,
+        np.where(n_top, 'cotton', np.where(p_top, 'potato', 'banana')),
+        np.where(n_top, 'wheat', np.where(p_top, 'potato', 'mungbean')),
+    ).astype(object)
+
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, str):
+            labels[branch == index] = outcome
+
+    groups = [(index, outcome) for index, outcome in enumerate(outcomes) if not isinstance(outcome, str)]
+    random_rows = np.flatnonzero(np.isin(branch, [index for index, _ in groups]))
+    if len(random_rows):
+        sizes = np.zeros(len(outcomes) + 1, dtype=np.int64)
+        for index, options in groups:
+            sizes[index] = len(options)
+        highs = sizes[branch[random_rows]]
+        if isinstance(rng, np.random.Generator):
+            picks = rng.integers(0, highs)
+        else:
+            picks = rng.randint(0, highs)
+        for index, options in groups:
+            in_group = branch[random_rows] == index
+            labels[random_rows[in_group]] = np.array(options, dtype=object)[picks[in_group]]
+    return labels
+
+
+def make_synthetic_dataset(n_samples=N_SAMPLES, seed=SEED):
+    """
+    The simplified synthetic dataset: uniform random soil and climate
+    values labelled by the rule cascade in assign_crop_simple.
+    """
+    np.random.seed(seed)
+    data = {
+        'N': np.random.uniform(0, 200, n_samples).round(1),
+        'P': np.random.uniform(0, 150, n_samples).round(1),
+        'K': np.random.uniform(0, 250, n_samples).round(1),
+        'rainfall': np.random.uniform(100, 400, n_samples).round(1),
+        'humidity': np.random.uniform(20, 95, n_samples).round(1),
+        'temperature': np.random.uniform(10, 40, n_samples).round(1),
+    }
+    df = pd.DataFrame(data)
+    df['label'] = label_crops(df)
+    return df
+
+
+def load_csv_dataset(path, feature_cols=FEATURE_COLS):
+    """Validated rows of a cd.csv-style file, in compact dtypes."""
+    df, _ = load_training_frame(path, feature_cols)
+    return df
+
+
+def what_if_grid(point, varied, span=0.25, steps=50, feature_cols=FEATURE_COLS, ranges=FEATURE_RANGES):
+    """
+    Rows that sweep one or two features of `point` (a feature -> value dict)
+    over +/- span of their range around the current value, holding the
+    others fixed. Returns (X, axes): X is a float32 (steps ** len(varied),
+    n_features) array in meshgrid "ij" order, axes maps each varied feature
+    to its values, so probabilities reshape to one cell per grid point.
+    """
+    axes = {}
+    for name in varied:
+        low, high = ranges[name]
+        width = (high - low) * span
+        start = max(low, point[name] - width)
+        stop = min(high, point[name] + width)
+        axes[name] = np.linspace(start, stop, steps, dtype=np.float32)
+
+    mesh = np.meshgrid(*axes.values(), indexing='ij')
+    X = np.empty((mesh[0].size, len(feature_cols)), dtype=np.float32)
+    for column, name in enumerate(feature_cols):
+        X[:, column] = point[name]
+    for name, values in zip(axes, mesh):
+        X[:, feature_cols.index(name)] = values.ravel()
+    return X, axes
+
+
+def base_dataset():
+    """The training rows before any field feedback."""
+    return load_csv_dataset(TRAINING_CSV) if TRAINING_CSV else make_synthetic_dataset()
+
+
+def training_key(df, feature_cols=FEATURE_COLS, params=MODEL_PARAMS):
+    """
+    Hash of the training rows, the feature list, the hyperparameters and the
+    scikit-learn version, so any change produces a different artifact.
+    """
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(df[feature_cols + ['label']], index=False).values.tobytes())
+    digest.update(json.dumps({'features': feature_cols, 'params': params}, sort_keys=True).encode())
+    digest.update(sklearn.__version__.encode())
+    return digest.hexdigest()[:16]
+
+
+def train_model(df, feature_cols=FEATURE_COLS, params=MODEL_PARAMS):
+    model = RandomForestClassifier(**params)
+    model.fit(df[feature_cols], df['label'])
+    return model
+
+
+def _touch(path):
+    # The mtime marks when an artifact was last used, for prune_model_cache().
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune_model_cache(cache_dir=None, keep=MODEL_CACHE_KEEP):
+    """Deletes all but the `keep` most recently used forest artifacts."""
+    by_age = []
+    for path in glob.glob(os.path.join(cache_dir or MODEL_CACHE_DIR, "crop_forest_*.joblib")):
+        try:
+            by_age.append((os.path.getmtime(path), path))
+        except OSError:
+            continue  # removed by another process meanwhile
+    for _, path in sorted(by_age, reverse=True)[max(keep, 1):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_or_train(df=None, feature_cols=FEATURE_COLS, params=MODEL_PARAMS, cache_dir=None):
+    """
+    Returns (model, info). info["source"] is "disk" when a matching artifact
+    was loaded, "trained" when the forest had to be fitted (and was then
+    saved), and info["seconds"] is how long that took.
+    """
+    start = time.perf_counter()
+    cache_dir = cache_dir or MODEL_CACHE_DIR
+    if df is None:
+        df = base_dataset()
+    key = training_key(df, feature_cols, params)
+    path = os.path.join(cache_dir, f"crop_forest_{key}.joblib")
+
+    if os.path.exists(path):
+        try:
+            model = joblib.load(path)
+            _touch(path)
+            return model, {"source": "disk", "key": key, "path": path, "seconds": time.perf_counter() - start}
+        except Exception:
+            pass  # unreadable or truncated artifact; refit and overwrite it
+
+    model = train_model(df, feature_cols, params)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write then rename, so a concurrent reader never sees half a file.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+    prune_model_cache(cache_dir)
+    return model, {"source": "trained", "key": key, "path": path, "seconds": time.perf_counter() - start}
+
@@ -0,0 +1,176 @@
+"""
+Bulk crop scoring for soil-test sheets.
+
+Reads a CSV with the N, P, K, rainfall, humidity and temperature columns
+recom.py uses, in chunks, scores the chunks in worker processes with the
+recommender forest and writes the top-k crops and probabilities
+per row. Only a bounded number of chunks is in flight, so memory stays flat
+however large the input is. Output is CSV, or Parquet when the output name
+ends in .parquet (needs pyarrow).
+
+    python score.py soil_tests.csv scored.csv --top-k 3
+    python score.py soil_tests.csv scored.parquet --keep field_id --workers 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import recommender
+from forest import CompiledForest, compile_forest
+
+# ===================== WORKER =====================
+_forest = None
+
+
+def load_forest(path):
+    """
+    A compiled forest from a .npz, or compiled from a fitted .joblib forest.
+    Only the latter keeps the fitted model, which predict_proba hands
+    chunks of more than forest.MODEL_ROWS rows to; a .npz always walks.
+    """
+    if path.endswith(".npz"):
+        return CompiledForest.load(path)
+    return compile_forest(joblib.load(path))
+
+
+def _init_worker(path):
+    # Each worker loads the model once; no pickled forest per chunk.
+    global _forest
+    _forest = load_forest(path)
+
+
+def score_chunk(features, top_k):
+    """
+    (top-k class indices, their probabilities) for each row; rows with a
+    missing or non-numeric input get index -1 and NaN.
+    """
+    valid = ~np.isnan(features).any(axis=1)
+    indices = np.full((len(features), top_k), -1, dtype=np.int32)
+    probabilities = np.full((len(features), top_k), np.nan, dtype=np.float32)
+    if valid.any():
+        proba = _forest.predict_proba(features[valid])
+        top = np.argsort(-proba, axis=1, kind='stable')[:, :top_k]
+        indices[valid] = top
+        probabilities[valid] = np.take_along_axis(proba, top, axis=1)
+    return indices, probabilities
+
+
+# ===================== OUTPUT =====================
+def result_frame(chunk, keep, classes, indices, probabilities):
+    out = chunk[keep].reset_index(drop=True) if keep else pd.DataFrame(index=range(len(chunk)))
+    labels = np.append(classes, '').astype(object)  # index -1 -> ''
+    for rank in range(indices.shape[1]):
+        out[f'crop_{rank + 1}'] = labels[indices[:, rank]]
+        out[f'prob_{rank + 1}'] = probabilities[:, rank].round(4)
+    return out
+
+
+class CSVWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.header = True
+
+    def write(self, frame):
+        frame.to_csv(self.file, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow), or write .csv instead")
+        self.path = path
+        self.writer = None
+
+    def write(self, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+# ===================== MAIN =====================
+def model_path(args, tmp_dir):
+    if args.model:
+        return args.model
+    fitted, _ = recommender.load_or_train()
+    # A private copy: the model cache may prune its artifact while workers start.
+    path = os.path.join(tmp_dir, "crop_forest.joblib")
+    joblib.dump(fitted, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV with N, P, K, rainfall, humidity, temperature columns")
+    parser.add_argument("output", help=".csv or .parquet")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--keep", default="", help="comma-separated input columns to copy into the output")
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--model", help="fitted forest .joblib, or compiled forest .npz (slower on large chunks; "
+                                        "default: the recommender's cached model)")
+    args = parser.parse_args()
+
+    keep = [column for column in args.keep.split(",") if column]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = model_path(args, tmp_dir)
+        classes = load_forest(path).classes_
+        top_k = min(args.top_k, len(classes))
+        writer = ParquetWriter(args.output) if args.output.endswith(".parquet") else CSVWriter(args.output)
+
+        reader = pd.read_csv(args.input, chunksize=args.chunksize, usecols=recommender.FEATURE_COLS + keep)
+        rows = 0
+        start = time.perf_counter()
+        with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(path,)) as pool:
+            # At most two chunks per worker in flight; results are written in input order.
+            in_flight = deque()
+
+            def drain_one():
+                nonlocal rows
+                chunk, future = in_flight.popleft()
+                indices, probabilities = future.result()
+                writer.write(result_frame(chunk, keep, classes, indices, probabilities))
+                rows += len(chunk)
+                elapsed = time.perf_counter() - start
+                print(f"\r{rows:,} rows  {rows / elapsed:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+            for chunk in reader:
+                features = np.column_stack([
+                    pd.to_numeric(chunk[name], errors='coerce').to_numpy(dtype=np.float32)
+                    for name in recommender.FEATURE_COLS
+                ])
+                in_flight.append((chunk, pool.submit(score_chunk, features, top_k)))
+                if len(in_flight) >= 2 * args.workers:
+                    drain_one()
+            while in_flight:
+                drain_one()
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\nscored {rows:,} rows in {elapsed:.1f} s ({rows / max(elapsed, 1e-9):,.0f} rows/s) -> {args.output}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
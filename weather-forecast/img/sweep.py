@@ -0,0 +1,234 @@
+"""
+Hyperparameter sweep for the crop forest in recommender.py.
+
+Every combination of the given values is cross-validated in a process
+pool. Each result records accuracy, fit time (CPU seconds, which the
+other workers sharing the machine barely move), single-row predict
+latency and the saved artifact size, and the report marks the Pareto front
+over accuracy, latency and size. Latency is measured on the compiled
+forest recom.py serves, one configuration at a time after the pool has
+finished, so no timing runs alongside another worker.
+
+    python sweep.py --n-estimators 25,50,100,200 --max-depth 6,8,10,none
+    python sweep.py --csv cd.csv --min-accuracy 0.9 --out sweep.csv
+"""
+import argparse
+import io
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import KFold, StratifiedKFold
+
+import recommender
+from forest import CompiledForest, compile_forest
+
+SWEEP_PARAMS = ("n_estimators", "max_depth", "min_samples_split", "min_samples_leaf", "max_features")
+
+
+# ===================== FOLDS =====================
+def fold_splits(df, n_folds, seed, cache_dir=None):
+    """
+    (train, test) index pairs for df, computed once per dataset and fold
+    count and kept next to the model artifacts, so repeated sweeps (and
+    every worker) score configurations on exactly the same splits.
+    """
+    cache_dir = cache_dir or recommender.MODEL_CACHE_DIR
+    key = recommender.training_key(df, params={"folds": n_folds, "seed": seed})
+    path = os.path.join(cache_dir, f"folds_{key}.npz")
+    if os.path.exists(path):
+        with np.load(path) as data:
+            return [(data[f"train_{i}"], data[f"test_{i}"]) for i in range(n_folds)]
+
+    y = df['label'].to_numpy()
+    smallest = pd.Series(y).value_counts().min()
+    # Stratify when every class can appear in every fold.
+    splitter = StratifiedKFold if smallest >= n_folds else KFold
+    splits = list(splitter(n_splits=n_folds, shuffle=True, random_state=seed).split(np.zeros(len(y)), y))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **{f"train_{i}": train for i, (train, _) in enumerate(splits)},
+             **{f"test_{i}": test for i, (_, test) in enumerate(splits)})
+    os.replace(tmp_path, path)
+    return splits
+
+
+# ===================== WORKER =====================
+_data = {}
+
+
+def _init_worker(X, y, splits, forest_dir):
+    # Shipped once per worker instead of once per configuration.
+    _data.update(X=X, y=y, splits=splits, forest_dir=forest_dir)
+
+
+def artifact_bytes(model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.getbuffer().nbytes
+
+
+def single_row_latency_ms(compiled, X, repeats=200):
+    rows = X[np.arange(repeats) % len(X)]
+    compiled.predict_proba(rows[:1])
+    timings = []
+    for row in rows:
+        start = time.perf_counter()
+        compiled.predict_proba(row[None])
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def evaluate(index, params):
+    X, y, splits = _data["X"], _data["y"], _data["splits"]
+    accuracies, fit_seconds = [], []
+    for train, test in splits:
+        model = RandomForestClassifier(**params)
+        start = time.process_time()
+        model.fit(X[train], y[train])
+        fit_seconds.append(time.process_time() - start)
+        accuracies.append(float(np.mean(model.predict(X[test]) == y[test])))
+
+    # Latency (timed later, see measure_latency) and size from the last
+    # fold's model: same shape as the shipped one.
+    forest_path = os.path.join(_data["forest_dir"], f"forest_{index}.npz")
+    compile_forest(model).save(forest_path)
+    return {
+        **params,
+        "accuracy": float(np.mean(accuracies)),
+        "accuracy_std": float(np.std(accuracies)),
+        "fit_s": float(np.mean(fit_seconds)),
+        "forest_path": forest_path,
+        "size_kb": artifact_bytes(model) / 1024,
+        "nodes": int(sum(estimator.tree_.node_count for estimator in model.estimators_)),
+    }
+
+
+def measure_latency(results, X_test):
+    """Single-row latency of each saved forest, one at a time in this process."""
+    for result in results:
+        result["predict_ms"] = single_row_latency_ms(CompiledForest.load(result.pop("forest_path")), X_test)
+    return results
+
+
+# ===================== REPORT =====================
+def pareto_front(results, objectives=(("accuracy", max), ("predict_ms", min), ("size_kb", min))):
+    """Marks each result that no other result beats or ties on every objective."""
+    def at_least_as_good(a, b):
+        return all((a[key] >= b[key]) if better is max else (a[key] <= b[key]) for key, better in objectives)
+
+    for result in results:
+        result["pareto"] = not any(
+            other is not result and at_least_as_good(other, result)
+            and any(other[key] != result[key] for key, _ in objectives)
+            for other in results
+        )
+    return results
+
+
+def accuracy_bar(results):
+    """
+    Default bar: the best mean accuracy less its spread across folds. Forests
+    within one standard deviation of the best are not meaningfully worse.
+    """
+    best = max(results, key=lambda result: result["accuracy"])
+    return best["accuracy"] - best["accuracy_std"]
+
+
+def recommend(results, min_accuracy):
+    """Smallest, then fastest, configuration that meets the accuracy bar."""
+    passing = [result for result in results if result["accuracy"] >= min_accuracy]
+    if not passing:
+        return None
+    return min(passing, key=lambda result: (result["size_kb"], result["predict_ms"]))
+
+
+def print_report(results, best, min_accuracy):
+    header = (f"{'trees':>5} {'depth':>5} {'split':>5} {'leaf':>4} {'feat':>5}  {'acc':>6} {'±':>5} "
+              f"{'fit s':>6} {'pred ms':>7} {'size KB':>8} {'nodes':>7}  pareto")
+    print(header)
+    for r in sorted(results, key=lambda r: (-r["accuracy"], r["size_kb"])):
+        print(
+            f"{r['n_estimators']:>5} {str(r['max_depth']):>5} {r['min_samples_split']:>5} {r['min_samples_leaf']:>4} "
+            f"{str(r['max_features']):>5}  {r['accuracy']:6.3f} {r['accuracy_std']:5.3f} {r['fit_s']:6.2f} "
+            f"{r['predict_ms']:7.3f} {r['size_kb']:8.0f} {r['nodes']:>7}  {'*' if r['pareto'] else ''}"
+        )
+    if best is None:
+        print(f"\nno configuration reaches accuracy {min_accuracy:.3f}")
+    else:
+        params = {key: best[key] for key in SWEEP_PARAMS}
+        print(f"\nsmallest forest with accuracy >= {min_accuracy:.3f}: {params} "
+              f"({best['accuracy']:.3f}, {best['predict_ms']:.3f} ms, {best['size_kb']:.0f} KB)")
+
+
+# ===================== MAIN =====================
+def parse_values(text, cast):
+    return [None if value.strip().lower() == "none" else cast(value) for value in text.split(",")]
+
+
+def max_features_value(value):
+    try:
+        return float(value) if "." in value else int(value)
+    except ValueError:
+        return value  # "sqrt", "log2"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", help="train on this cd.csv-style file instead of the synthetic rows")
+    parser.add_argument("--n-estimators", default="25,50,100,200")
+    parser.add_argument("--max-depth", default="6,8,10,none")
+    parser.add_argument("--min-samples-split", default="5")
+    parser.add_argument("--min-samples-leaf", default="1,2,4")
+    parser.add_argument("--max-features", default="sqrt")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=recommender.SEED)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--min-accuracy", type=float,
+                        help="accuracy the recommended forest must reach "
+                             "(default: the best accuracy less its standard deviation across folds)")
+    parser.add_argument("--out", help="also write the results to this CSV")
+    args = parser.parse_args()
+
+    df = recommender.load_csv_dataset(args.csv) if args.csv else recommender.make_synthetic_dataset()
+    X = df[recommender.FEATURE_COLS].to_numpy(dtype=np.float32)
+    y = df['label'].to_numpy()
+    splits = fold_splits(df, args.folds, args.seed)
+
+    grid = [
+        dict(zip(SWEEP_PARAMS, values), random_state=args.seed)
+        for values in itertools.product(
+            parse_values(args.n_estimators, int),
+            parse_values(args.max_depth, int),
+            parse_values(args.min_samples_split, int),
+            parse_values(args.min_samples_leaf, int),
+            parse_values(args.max_features, max_features_value),
+        )
+    ]
+    print(f"{len(grid)} configurations x {args.folds} folds on {len(df)} rows, {args.workers} workers")
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as forest_dir:
+        with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(X, y, splits, forest_dir)) as pool:
+            results = list(pool.map(evaluate, range(len(grid)), grid))
+        print(f"swept in {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        measure_latency(results, X[splits[-1][1]])
+    print(f"timed single-row latency in {time.perf_counter() - start:.1f} s\n")
+
+    min_accuracy = accuracy_bar(results) if args.min_accuracy is None else args.min_accuracy
+    pareto_front(results)
+    print_report(results, recommend(results, min_accuracy), min_accuracy)
+    if args.out:
+        pd.DataFrame(results).drop(columns="random_state").to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
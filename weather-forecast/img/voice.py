@@ -0,0 +1,128 @@
+"""
+Voice assistant for the disease apps (cd.py, po.py).
+
+Speech is synthesized ahead of time into audio files under VOICE_CACHE_DIR,
+one per distinct text, by a single background thread that owns the only
+pyttsx3 engine in the process. The apps play the files with st.audio, so a
+"Hear ..." button never waits for the speech engine.
+"""
+import hashlib
+import os
+import queue
+import threading
+
+VOICE_CACHE_DIR = os.environ.get(
+    "VOICE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "voice_cache")
+)
+VOICE_RATE = int(os.environ.get("VOICE_RATE", "150"))
+VOICE_VOLUME = float(os.environ.get("VOICE_VOLUME", "0.9"))
+
+WELCOME_TEXT = (
+    "Welcome to the Crop Disease Detection System. I am your voice assistant. "
+    "I will help you understand the disease detection results."
+)
+
+
+def speech_texts(disease_name, disease_info):
+    """The spoken diagnosis, treatments and prevention for one database entry."""
+    diagnosis = f"Disease detected: {disease_name}. Severity: {disease_info['severity']}."
+    if disease_info['affected_crops']:
+        diagnosis += f" This disease affects: {', '.join(disease_info['affected_crops'])}."
+
+    solutions = disease_info['solutions']
+    chemical = solutions['chemical'][0] if solutions['chemical'] else "Consult agricultural expert"
+    organic = solutions['organic'][0] if solutions['organic'] else "Use neem oil spray"
+    treatments = f"Recommended treatments. Chemical treatment: {chemical}. Organic option: {organic}."
+
+    tips = disease_info['prevention']
+    if len(tips) > 1:
+        prevention = f"Prevention tips: {tips[0]}. Also remember to: {tips[1]}."
+    elif tips:
+        prevention = f"Prevention tip: {tips[0]}."
+    else:
+        prevention = "Practice crop rotation and monitor plants regularly."
+
+    return {"diagnosis": diagnosis, "treatments": treatments, "prevention": prevention}
+
+
+class VoiceAssistant:
+    """
+    Cache of synthesized speech. audio(text) returns the file to play if it
+    exists and otherwise queues it for the synthesis thread; prerender()
+    queues a batch up front. Created from st.cache_resource, so one engine
+    serves every session.
+    """
+
+    def __init__(self, cache_dir=VOICE_CACHE_DIR, rate=VOICE_RATE, volume=VOICE_VOLUME):
+        self.cache_dir = cache_dir
+        self.rate = rate
+        self.volume = volume
+        self.error = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._queued = set()
+        threading.Thread(target=self._run, name="voice-synthesis", daemon=True).start()
+
+    def path(self, text):
+        # Settings are part of the key, so changing the voice re-renders instead of reusing stale clips.
+        key = hashlib.sha1(f"{self.rate}|{self.volume}|{text}".encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def audio(self, text):
+        """Path of the clip for `text`, or None after queueing it for synthesis."""
+        path = self.path(text)
+        if os.path.exists(path):
+            return path
+        with self._lock:
+            if self.error is None and path not in self._queued:
+                self._queued.add(path)
+                self._queue.put((text, path))
+        return None
+
+    def prerender(self, texts):
+        for text in texts:
+            self.audio(text)
+
+    @property
+    def pending(self):
+        return len(self._queued)
+
+    def _init_engine(self):
+        import pyttsx3
+
+        engine = pyttsx3.init()
+        engine.setProperty('rate', self.rate)
+        engine.setProperty('volume', self.volume)
+        # Use a female voice if available
+        for voice in engine.getProperty('voices'):
+            if 'female' in voice.name.lower():
+                engine.setProperty('voice', voice.id)
+                break
+        return engine
+
+    def _run(self):
+        # pyttsx3 engines are not thread-safe: this thread is the only one that touches it.
+        try:
+            engine = self._init_engine()
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except Exception as e:
+            with self._lock:
+                self.error = f"Voice feature unavailable ({e}). Please install pyttsx3 with: pip install pyttsx3"
+                self._queued.clear()
+            return
+
+        while True:
+            text, path = self._queue.get()
+            tmp_path = f"{path}.{os.getpid()}.tmp.wav"
+            try:
+                engine.save_to_file(text, tmp_path)
+                engine.runAndWait()
+                # Readers only ever see a missing clip or a complete one.
+                os.replace(tmp_path, path)
+            except Exception:
+                # Keep the worker alive; the next audio() call queues the text again.
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            finally:
+                with self._lock:
+                    self._queued.discard(path)